@@ -1,19 +1,32 @@
 import pyaudio
 import tkinter as tk
-import io
 import wave
 import multiprocessing
+import threading
+import queue
+import concurrent.futures
+import functools
+import collections
+import math
+import string
+from multiprocessing import shared_memory
+from typing import NamedTuple
 
 import numpy as np
 from faster_whisper import WhisperModel
-from faster_whisper.vad import get_speech_timestamps
 from faster_whisper.vad import get_vad_model
 from faster_whisper.vad import VadOptions
-from faster_whisper.audio import decode_audio
+from faster_whisper.vad import get_speech_timestamps, collect_chunks, SpeechTimestampsMap
+from faster_whisper.audio import pad_or_trim
+from faster_whisper.tokenizer import Tokenizer
+from faster_whisper.transcribe import get_ctranslate2_storage, get_suppressed_tokens, get_compression_ratio, merge_punctuations
+from faster_whisper.utils import get_assets_path
 
 import datetime
+import time
 import uuid
 import os 
+import signal
 import cProfile
 import pstats
 
@@ -35,14 +48,112 @@ import pstats
 ###--- Audio recording parameters ---###
 FORMAT = pyaudio.paInt16
 CHANNELS = 1
-RATE = 48000
+RATE = None # Capture rate of the input device in Hz, None uses the device default rate
 CHUNK = 1024
+MODEL_RATE = 16000 # Sample rate expected by the VAD and whisper models
+RESAMPLER_TAPS = 64 # Filter taps per polyphase branch of the resampler, counted at the lower of the two rates
+RESAMPLER_CUTOFF = 0.96 # Resampler cutoff as a fraction of the lower Nyquist frequency, so the stopband starts before frequencies alias into the band
+RESAMPLER_BLOCK = 16384 # Number of output samples computed per vectorized resampling step
 
-SILENCE_CHUNK_LENGTH = 1 # Length of silence chunks in seconds
 AUDIO_CHUNK_LENGTH = 4 # Length of audio chunks in seconds
-device_id = 6
+RING_BUFFER_LENGTH = 120 # Capacity of the capture ring buffer in seconds
+CAPTURE_STATS_INTERVAL = 10 # Seconds between capture overflow/underrun reports
+device_ids = [6] # PyAudio indices of the input devices, each one is captured as its own stream
+
+AUDIO_SOURCES = None # None records from device_ids, a list of audio files or log_files/<session> directories replays their streams
+REPLAY_SPEED = 1.0 # Replay pace as a multiple of real time, None replays as fast as the pipeline can take it
 ###--- End Audio recording parameters ---###
 
+###--- Audio archive parameters ---###
+ARCHIVE_FORMAT = 'WAV' # Format of the session audio archives: 'WAV', or 'FLAC' and 'OPUS' which need the soundfile package
+ARCHIVE_INTERVAL = 1.0 # Seconds between writes of newly captured audio to the archives, must stay well below RING_BUFFER_LENGTH
+ARCHIVE_EXTENSIONS = {'WAV': '.wav', 'FLAC': '.flac', 'OPUS': '.opus'}
+###--- End Audio archive parameters ---###
+
+###--- Voice activity detection parameters ---###
+VAD_THRESHOLD = 0.6 # Speech probability above which a window counts as speech
+VAD_MIN_SILENCE_MS = 500 # Silence needed after speech before a speech-end event is emitted
+VAD_MIN_SPEECH_MS = 250 # Speech needed before a speech-start event is emitted, shorter blips are dropped
+VAD_WINDOW = 512 # Samples scored per Silero VAD call at MODEL_RATE
+ENDPOINT_HANGOVER_MS = 800 # Silence after the end of speech before the utterance is finalized, at least VAD_MIN_SILENCE_MS
+VAD_SPEECH_PAD_MS = 400 # Audio kept on each side of the speech regions sent with a chunk, as get_speech_timestamps pads them
+VAD_THREADS = 1 # Intra-op threads of the shared VAD ONNX session, kept low so VAD does not compete with whisper
+###--- End Voice activity detection parameters ---###
+
+###--- Transcription worker parameters ---###
+WORKER_COUNT = 1 # Number of model_server processes, each loads its own model
+WORKER_CPU_THREADS = 0 # CTranslate2 threads per worker, 0 lets CTranslate2 decide
+WORKER_NUM_WORKERS = 1 # CTranslate2 concurrent translators per worker
+REBALANCE_INTERVAL = 10 # Seconds between checks of the load of the workers
+REBALANCE_THRESHOLD = 0.2 # Difference in busy fraction between the most and least loaded workers that triggers a stream migration
+###--- End Transcription worker parameters ---###
+
+###--- Streaming confirmation parameters ---###
+PROMPT_CHARACTERS = 200 # Characters of the end of the confirmed transcript passed to the model as initial prompt
+COMMIT_OVERLAP_WORDS = 5 # Longest run of confirmed words searched for at the start of a new hypothesis when dropping repeated words
+MAX_BUFFER_SECONDS = 20 # Unconfirmed audio kept per stream, words are force-committed before a chunk outgrows it. Chunks sent before the prune arrives can be longer
+DECODE_WINDOW_SECONDS = 10 # Speech decoded per model window, longer chunks are split between speech regions so their transcription can be stopped early
+DEFERRED_ALIGNMENT = False # Transcribe without word timestamps and only align the words when some of them are about to be committed
+DEFERRED_ALIGNMENT_MAX_RATE = 0.5 # Deferral pauses while more than this fraction of recent ticks commit words, each of those pays a second encoder pass
+DEFERRED_ALIGNMENT_WINDOW = 20 # Recent ticks the commit rate is measured over
+STREAM_PARTIAL_SEGMENTS = False # Send each segment to the display process as soon as it is decoded, before the chunk's transcript update
+PARTIAL_WINDOW_SECONDS = 3 # Speech decoded per model window with STREAM_PARTIAL_SEGMENTS, each window costs a full encoder pass without REDUCED_AUDIO_CONTEXT
+###--- End Streaming confirmation parameters ---###
+
+###--- Cascade parameters ---###
+CASCADE_MODE = False # Draft the unconfirmed transcript with the main model and confirm the agreed words with CONFIRM_MODEL in the background
+DRAFT_BEAM_SIZE = 1 # Beam size of the drafts in cascade mode, 1 is greedy decoding
+CONFIRM_MODEL = "base.en" # Model that produces the confirmed transcript in cascade mode
+CONFIRM_BEAM_SIZE = 5
+CONFIRM_MIN_SECONDS = 5.0 # Committed drafts are confirmed together once they span this long, end a sentence or close an utterance
+CONFIRM_PAD_MS = 200 # Audio added on each side of a confirmed span, so the edge words are not clipped at their draft alignment times
+###--- End Cascade parameters ---###
+
+###--- Adaptive decoding parameters ---###
+ADAPTIVE_DECODING = True # Step down to cheaper decoding settings when transcription falls behind, and back up when there is headroom
+TEMPERATURE_FALLBACK = [0.0, 0.2, 0.4, 0.6, 0.8, 1.0] # Temperatures tried in turn when a decoding fails the compression ratio or log probability thresholds
+DECODING_LEVELS = [ # Decoding settings from the most accurate to the cheapest
+    {'beam_size': 5, 'best_of': 5, 'temperature': TEMPERATURE_FALLBACK},
+    {'beam_size': 1, 'best_of': 5, 'temperature': TEMPERATURE_FALLBACK},
+    {'beam_size': 1, 'best_of': 2, 'temperature': TEMPERATURE_FALLBACK},
+    {'beam_size': 1, 'best_of': 1, 'temperature': 0.0},
+]
+DECODING_LAG_SLO = 2 * AUDIO_CHUNK_LENGTH # Seconds from capture to transcript the controller keeps chunks under
+DECODING_RTF_HIGH = 1.0 # Smoothed real-time factor of the calls above which decoding steps down
+DECODING_RTF_LOW = 0.5 # Smoothed real-time factor below which decoding steps back up, if the lag is also under half the SLO
+DECODING_SMOOTHING = 0.3 # Weight of the latest call in the smoothed real-time factor and lag
+DECODING_PATIENCE = 3 # Calls measured after a change before the next one, so each change is judged on its own effect
+###--- End Adaptive decoding parameters ---###
+
+###--- Audio context parameters ---###
+REDUCED_AUDIO_CONTEXT = False # Encode a context sized to the chunk instead of a full 30 s window, needs a CTranslate2 build whose Whisper encoder accepts shorter inputs
+AUDIO_CONTEXT_STEP = 2 # Seconds the reduced context is rounded up to, so the encoder only sees a few input shapes
+###--- End Audio context parameters ---###
+
+###--- Batched inference parameters ---###
+BATCHED_INFERENCE = False # Transcribe the pending chunks of several streams together in one encoder and decoder call
+BATCH_SIZE = 8 # Maximum number of chunks transcribed together
+BATCH_LATENCY_BUDGET = 0.1 # Seconds to wait for chunks of other streams before transcribing a partial batch
+###--- End Batched inference parameters ---###
+
+###--- Chunk trigger parameters ---###
+EARLY_CHUNKS = True # Send chunks shortly after a speech onset and at an adaptive cadence during speech, within CHUNK_BUDGET
+ONSET_DELAY = 0.6 # Seconds of audio after a VAD speech onset before the speculative chunk is sent
+MIN_CHUNK_INTERVAL = 1.0 # Seconds between chunks during speech while the stream's worker is idle, growing to AUDIO_CHUNK_LENGTH as it gets busy
+CADENCE_LOAD_LOW = 0.3 # Busy fraction of the stream's worker up to which chunks are sent every MIN_CHUNK_INTERVAL
+CHUNK_BUDGET = 0.5 # Chunks per second of audio a stream may send on average, the regular chunks included
+CHUNK_BURST = 2 # Chunks a stream may send in a burst above its average rate
+###--- End Chunk trigger parameters ---###
+
+###--- Energy gate parameters ---###
+ENERGY_GATE = True # Skip VAD and transcription for audio the energy gate marks as silent
+ENERGY_GATE_RATIO = 3.0 # RMS above this multiple of the noise floor opens the gate
+ENERGY_GATE_ZCR = 0.3 # Zero crossings per sample above which quieter windows above the noise floor count as possible fricatives
+ENERGY_GATE_FLOOR_RISE = 1.002 # Factor by which the noise floor may rise per window, it drops to any quieter window immediately
+ENERGY_GATE_MIN_FLOOR = 1e-4 # Lowest noise floor RMS, so digital silence does not make every sound open the gate
+ENERGY_GATE_HANGOVER = 16 # Windows the gate stays open after the last window above the floor
+###--- End Energy gate parameters ---###
+
 ###############################################################################################
 
 ######------ Functions ------######
@@ -50,87 +161,792 @@ device_id = 6
 #- Multiprocessing functions -#
 
 #TODO: Implement verified/immutable transcript vs unverified transcript, so that verified transcript is not changed or taking up compuation resources
-def model_server(input_queue, output_queue, buffer_prune_queue, log_queue):
+def model_server(input_queue, output_queue, buffer_prune_queue, log_queue, worker_id=0, worker_queues=None, load_queue=None, ready_queue=None,
+                 recording_started=None):
     """
     model_server transcribes audio data into text segments.
 
+    Chunks from every capture stream share the one model. Pending chunks are served round-robin across
+    streams so a busy stream cannot starve the others, and each stream keeps its own transcript.
+    Chunks superseded by a newer chunk of the same stream before they were picked up are dropped, so
+    when transcription falls behind it skips ahead to the latest audio instead of building a backlog.
+
+    Several model_server processes can run as a WorkerPool. Each stream is then served by one worker,
+    and WorkerControl messages on input_queue hand a stream's transcript over to another worker.
+
     Args:
-        input_queue (Queue): Queue for receiving audio data from the recording program.
+        input_queue (Queue): Queue for receiving ChunkDescriptors of the shared audio buffers from the recording program.
         output_queue (Queue): Queue for sending transcribed text segments to the display process.
-        buffer_prune_queue (Queue): Queue for sending pruning location in the audio buffer.
+        buffer_prune_queue (Queue): Queue for sending (stream ID, absolute sample position) at which to prune an audio buffer.
         log_queue (Queue): Queue for logging information.
+        worker_id (int, optional): Index of this worker in the pool. Defaults to 0.
+        worker_queues (list, optional): Input queues of every worker in the pool, used to hand streams over. Defaults to None.
+        load_queue (Queue, optional): Queue for reporting (stream ID, seconds spent transcribing, chunk sequence) to the pool. Defaults to None.
+        ready_queue (Queue, optional): Queue for reporting (worker ID, seconds per startup stage) once the models are warmed up. Defaults to None.
+        recording_started (Value, optional): Shared wall clock time recording started at, 0 until then, for logging the time
+            to the first transcript. Defaults to None.
 
     Returns:
         None
     """
 
-    model = initialize_model(log_queue)
+    # Ctrl+C reaches the whole process group, but only the main process handles it: it stops recording and
+    # shuts the workers down through their queues, so the chunks queued are finished and the summaries logged
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    # The fallback VAD, for chunks sent without speech regions and for VadStats' calibration, is loaded and warmed up
+    # on a thread while the model loads, then the model is warmed up with one transcription, so the first chunk does
+    # not pay for loading or lazy initialization. The VAD that scores the audio runs in the capture process
+    startup_start = time.perf_counter()
+    stage_seconds = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        vad_future = executor.submit(run_startup_stage, stage_seconds, 'fallback_vad', warm_up_vad)
+        model = run_startup_stage(stage_seconds, 'model', initialize_model, log_queue, cpu_threads=WORKER_CPU_THREADS,
+                                  num_workers=WORKER_NUM_WORKERS)
+        run_startup_stage(stage_seconds, 'tokenizer', warm_up_tokenizer, model)
+        run_startup_stage(stage_seconds, 'warm_up', warm_up_model, model)
+        vad_future.result()
+    # The VAD cost is calibrated once nothing else is loading
+    vad_stats = VadStats()
+    alignment_stats = AlignmentStats()
+    reduced_context = REDUCED_AUDIO_CONTEXT and supports_reduced_context(model, log_queue)
+    # In cascade mode the drafts start at the first level as cheap as DRAFT_BEAM_SIZE
+    top_level = next(level for level, options in enumerate(DECODING_LEVELS) if not CASCADE_MODE or options['beam_size'] <= DRAFT_BEAM_SIZE)
+    controller = DecodingController(top_level)
+    draft_stats = TierStats('draft' if CASCADE_MODE else 'transcribe')
+    cpu_meter = CpuMeter()
     
-    confirmed_transcript=''
+    # Shared audio buffers mapped so far, by shared memory name
+    audio_buffers = {}
+    # StreamTranscripts by stream ID
+    transcripts = {}
+    confirmer = (run_startup_stage(stage_seconds, 'confirm_model', CascadeConfirmer, audio_buffers, output_queue, log_queue, cpu_meter)
+                 if CASCADE_MODE else None)
+    stage_seconds['total'] = time.perf_counter() - startup_start
+    log_queue.put(f'{datetime.datetime.now().strftime("%H:%M:%S")}|WORKER_READY|worker={worker_id}|'
+                  + '|'.join(f'{stage}={seconds:.3f}' for stage, seconds in stage_seconds.items()))
+    if ready_queue is not None:
+        ready_queue.put((worker_id, stage_seconds))
+    first_transcript = False
+    scheduler = FairScheduler()
+    # WorkerControls and the shutdown signal received while a chunk was being transcribed
+    deferred_controls = []
+    shutdown = False
     while True:
-        # Receive audio data from the recording program
-        audio_data, chunk_id = input_queue.get()
-
-        # NOTE: Temporary shutdown signal
-        if audio_data is None: 
-            print("\nTranscription process terminated.") 
+        # Receive the location of the audio data from the recording program, only waiting when nothing is pending
+        # Streams being handed over to this worker are waited for even after the shutdown signal
+        if not shutdown or scheduler.held:
+            shutdown = receive_chunks(input_queue, scheduler, transcripts, worker_queues, log_queue, block=not scheduler) or shutdown
+
+        # NOTE: Temporary shutdown signal, the chunks queued before it are still transcribed
+        if not scheduler:
+            if scheduler.held:
+                continue
             break
-        
-        time_at = datetime.datetime.now().strftime("%H:%M:%S")
-        unconfirmed_transcript=''
-        
-        # Transcribe the audio data into segments of text
-        segments, info = model.transcribe(audio_data, beam_size=5, vad_filter=True, word_timestamps=True)
 
-        num_sentences = 0
-        words_list = []
+        # In batched mode, chunks of the other streams are waited for within the latency budget
+        batch_size = 1
+        if BATCHED_INFERENCE:
+            deadline = time.perf_counter() + BATCH_LATENCY_BUDGET
+            while not shutdown and len(scheduler) < min(BATCH_SIZE, len(scheduler.order) - len(scheduler.held)):
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                shutdown = receive_chunks(input_queue, scheduler, transcripts, worker_queues, log_queue, block=True, timeout=remaining)
+            batch_size = min(BATCH_SIZE, len(scheduler))
+
+        descriptors = [scheduler.next() for _ in range(batch_size)]
+        for descriptor in descriptors:
+            scheduler.log_dispatch(descriptor, log_queue)
+            if descriptor.buffer_name not in audio_buffers:
+                audio_buffers[descriptor.buffer_name] = AudioRingBuffer.attach(descriptor.buffer_name, dtype=np.float32)
+            if descriptor.stream_id not in transcripts:
+                transcripts[descriptor.stream_id] = StreamTranscript(descriptor.stream_id)
+
+        decoding = controller.options()
+        busy_start = time.perf_counter()
+        cpu_start = cpu_meter.start(draft_stats.name)
+        if batch_size > 1:
+            transcribe_batch(model, audio_buffers, descriptors, transcripts, output_queue, buffer_prune_queue, log_queue,
+                             reduced_context, decoding, confirmer, vad_stats, alignment_stats)
+        else:
+            cancel = functools.partial(poll_superseded, input_queue, scheduler, transcripts, worker_queues, log_queue, deferred_controls, descriptors[0])
+            transcribe_chunk(model, audio_buffers[descriptors[0].buffer_name], descriptors[0], transcripts[descriptors[0].stream_id],
+                             output_queue, buffer_prune_queue, log_queue, reduced_context, decoding, confirmer, vad_stats, alignment_stats, cancel)
+            for control in deferred_controls:
+                if control is None:
+                    shutdown = True
+                else:
+                    handle_control(control, scheduler, transcripts, worker_queues, log_queue)
+            deferred_controls.clear()
+        draft_stats.record(time.perf_counter() - busy_start, cpu_meter.stop(draft_stats.name) - cpu_start,
+                           sum(descriptor.length for descriptor in descriptors) / MODEL_RATE)
+        if ADAPTIVE_DECODING:
+            controller.update(time.perf_counter() - busy_start, descriptors, log_queue)
+        if not first_transcript and any(transcript.confirmed_transcript or transcript.hypothesis for transcript in transcripts.values()):
+            first_transcript = True
+            if recording_started is not None:
+                log_queue.put(f'{datetime.datetime.now().strftime("%H:%M:%S")}|FIRST_TRANSCRIPT|worker={worker_id}'
+                              f'|since_recording={time.time() - recording_started.value:.3f}')
+        # The time of a batch is shared evenly between its streams
+        if load_queue is not None:
+            busy_seconds = (time.perf_counter() - busy_start) / batch_size
+            for descriptor in descriptors:
+                load_queue.put((descriptor.stream_id, busy_seconds, descriptor.sequence))
+
+    # The confirmations still queued are finished first, they read from the audio buffers
+    if confirmer is not None:
+        # Drafts still waiting for a long enough span are confirmed as they are
+        for transcript in transcripts.values():
+            confirmer.flush(transcript)
+        confirmer.close()
+    for audio_buffer in audio_buffers.values():
+        audio_buffer.close()
+    draft_stats.log_summary(log_queue)
+    controller.log_summary(log_queue)
+    vad_stats.log_summary(log_queue, worker_id)
+    alignment_stats.log_summary(log_queue, worker_id)
+    for transcript in transcripts.values():
+        transcript.log_latency_summary(log_queue)
+    scheduler.log_summary(log_queue)
+    print(f"\nTranscription process {worker_id} terminated.") 
+
+def receive_chunks(input_queue, scheduler, transcripts, worker_queues, log_queue, block, timeout=None, deferred_controls=None):
+    """
+    Move every chunk descriptor waiting on the input queue into the scheduler, and carry out WorkerControl messages.
+
+    The queue is drained completely before anything is transcribed, so chunks superseded by a newer
+    one are dropped before the model ever sees them.
+
+    Args:
+        input_queue (Queue): Queue of ChunkDescriptors and WorkerControls, with None as the shutdown signal.
+        scheduler (FairScheduler): The scheduler that receives the descriptors.
+        transcripts (dict): StreamTranscripts of the streams served by this worker, by stream ID.
+        worker_queues (list): Input queues of every worker in the pool.
+        log_queue (Queue): Queue for logging information.
+        block (bool): Whether to wait for the first descriptor.
+        timeout (float, optional): Seconds to wait for the first descriptor when blocking, None waits indefinitely. Defaults to None.
+        deferred_controls (list, optional): List to keep WorkerControls in instead of carrying them out. Defaults to None.
+
+    Returns:
+        bool: True if the shutdown signal was received.
+    """
+    try:
+        descriptor = input_queue.get(block=block, timeout=timeout)
+        while descriptor is not None:
+            if isinstance(descriptor, WorkerControl) and deferred_controls is not None:
+                deferred_controls.append(descriptor)
+                descriptor = input_queue.get_nowait()
+                continue
+            if isinstance(descriptor, WorkerControl):
+                handle_control(descriptor, scheduler, transcripts, worker_queues, log_queue)
+                descriptor = input_queue.get_nowait()
+                continue
+            superseded = scheduler.add(descriptor)
+            if superseded is not None:
+                log_queue.put(f'{datetime.datetime.now().strftime("%H:%M:%S")}|{superseded.chunk_id}|SUPERSEDED|{descriptor.chunk_id}')
+            descriptor = input_queue.get_nowait()
+        return True
+    except queue.Empty:
+        return False
+
+def poll_superseded(input_queue, scheduler, transcripts, worker_queues, log_queue, deferred_controls, descriptor):
+    """
+    Receive the chunks that arrived while a chunk was being transcribed, and check whether one of them supersedes it.
+
+    WorkerControls and the shutdown signal are kept in deferred_controls until the transcription is done,
+    so a stream is never handed over while its transcript is being updated.
+
+    Args:
+        input_queue (Queue): Queue of ChunkDescriptors and WorkerControls, with None as the shutdown signal.
+        scheduler (FairScheduler): The scheduler that receives the descriptors.
+        transcripts (dict): StreamTranscripts of the streams served by this worker, by stream ID.
+        worker_queues (list): Input queues of every worker in the pool.
+        log_queue (Queue): Queue for logging information.
+        deferred_controls (list): List the WorkerControls are kept in, None stands for the shutdown signal.
+        descriptor (ChunkDescriptor): The chunk being transcribed.
+
+    Returns:
+        bool: True if a newer chunk of the same stream is pending.
+    """
+    if receive_chunks(input_queue, scheduler, transcripts, worker_queues, log_queue, block=False, deferred_controls=deferred_controls):
+        deferred_controls.append(None)
+    if not scheduler.superseded(descriptor):
+        return False
+    scheduler.cancelled += 1
+    return True
+
+def handle_control(control, scheduler, transcripts, worker_queues, log_queue):
+    """
+    Carry out a stream handover between workers.
+
+    The pool sends 'expect' to the new worker and 'release' to the old one. The old worker replies to the
+    new one with 'adopt', carrying the stream's transcript and its pending and final chunks. Until then the new worker
+    holds the chunks it receives for the stream, so the transcript is never continued from a stale state.
+
+    Args:
+        control (WorkerControl): The control message.
+        scheduler (FairScheduler): The scheduler of this worker.
+        transcripts (dict): StreamTranscripts of the streams served by this worker, by stream ID.
+        worker_queues (list): Input queues of every worker in the pool.
+        log_queue (Queue): Queue for logging information.
+
+    Returns:
+        None
+    """
+    if control.action == 'expect':
+        scheduler.hold(control.stream_id)
+    elif control.action == 'release':
+        if control.stream_id in scheduler.held:
+            # The stream moved on before its transcript got here, it is passed on when it arrives
+            scheduler.forwards[control.stream_id] = control.target
+            return
+        finals, descriptor = scheduler.remove(control.stream_id)
+        transcript = transcripts.pop(control.stream_id, None)
+        worker_queues[control.target].put(WorkerControl('adopt', control.stream_id, transcript=transcript, descriptor=descriptor,
+                                                        finals=finals))
+        log_queue.put(f'{datetime.datetime.now().strftime("%H:%M:%S")}|RELEASED_STREAM|stream={control.stream_id}|worker={control.target}')
+    elif control.action == 'adopt' and control.stream_id in scheduler.forwards:
+        target = scheduler.forwards.pop(control.stream_id)
+        scheduler.adopt(control.stream_id, control.descriptor, control.finals)
+        finals, descriptor = scheduler.remove(control.stream_id)
+        worker_queues[target].put(control._replace(descriptor=descriptor, finals=finals))
+    elif control.action == 'adopt':
+        if control.transcript is not None:
+            # Drafts queued before the handover are confirmed and shown by the old worker's confirm tier, this
+            # worker's confirmer would never pop them. Only the drafts of the span not queued yet are kept
+            drafts = control.transcript.cascade_span[3] if control.transcript.cascade_span is not None else 0
+            kept = list(control.transcript.pending_drafts)[len(control.transcript.pending_drafts) - drafts:]
+            control.transcript.pending_drafts = collections.deque(kept)
+            transcripts[control.stream_id] = control.transcript
+        scheduler.adopt(control.stream_id, control.descriptor, control.finals)
+
+def transcribe_chunk(model, audio_buffer, descriptor, transcript, output_queue, buffer_prune_queue, log_queue, reduced_context=False,
+                     decoding=None, confirmer=None, vad_stats=None, alignment_stats=None, cancel=None):
+    """
+    Transcribe one chunk, confirm the words it agrees on with the previous chunk and send the updated transcript to the display process.
+
+    Args:
+        model (WhisperModel): The model to transcribe with.
+        audio_buffer (AudioRingBuffer): The mapped shared audio buffer of the chunk's stream.
+        descriptor (ChunkDescriptor): Location of the chunk in the audio buffer.
+        transcript (StreamTranscript): Transcript state of the chunk's stream.
+        output_queue (Queue): Queue for sending transcribed text segments to the display process.
+        buffer_prune_queue (Queue): Queue for sending pruning locations in the audio buffers.
+        log_queue (Queue): Queue for logging information.
+        reduced_context (bool, optional): Whether to encode a context sized to the chunk. Defaults to False.
+        decoding (dict, optional): Decoding options passed to model.transcribe, one of DECODING_LEVELS. Defaults to beam search with 5 beams.
+        confirmer (CascadeConfirmer, optional): Confirm tier that transcribes the agreed words again in cascade mode. Defaults to None.
+        vad_stats (VadStats, optional): Counters of the VAD work done and saved. Defaults to None.
+        alignment_stats (AlignmentStats, optional): Timings of the transcription ticks and word alignments. Defaults to None.
+        cancel (callable, optional): Returns True once a newer chunk of the stream is waiting, checked before each model window after the first. Defaults to None.
+
+    With STREAM_PARTIAL_SEGMENTS each segment is sent to the display process as a PartialSegment as soon as
+    it is decoded, and the TranscriptUpdate sent by update_transcript closes the chunk. Segments only come
+    out window by window, so the windows are shortened to PARTIAL_WINDOW_SECONDS: the first words show up
+    after the first window instead of the whole chunk. Windows are only split between speech regions, a
+    chunk of one region is still a single window and its partials arrive just before its transcript update.
+
+    Returns:
+        None
+    """
+    time_at = datetime.datetime.now().strftime("%H:%M:%S")
+    
+    # The speech of the chunk is collected straight from shared memory, using the regions the capture VAD found
+    audio_data = audio_buffer.view(descriptor.offset, descriptor.offset + descriptor.length)
+    speech_chunks = chunk_speech_timestamps(descriptor, audio_data, vad_stats)
+    speech_audio = collect_chunks(audio_data, speech_chunks)
+
+    # The speech audio is a copy, so the shared audio only had to survive until here
+    if not audio_buffer.is_available(descriptor.offset):
+        log_queue.put(f'{datetime.datetime.now().strftime("%H:%M:%S")}|{descriptor.chunk_id}|CHUNK_OVERWRITTEN|{descriptor.sequence}')
+        return
+
+    words = []
+    aligner = None
+    if speech_chunks:
+        # The speech is decoded in windows of about DECODE_WINDOW_SECONDS, one model.transcribe call each. faster-whisper
+        # decodes a whole window before it yields its first segment, so a window is the unit that can be skipped: once a
+        # newer chunk of the stream is waiting, the windows decoded so far are kept and the rest is never decoded. Final
+        # chunks are always transcribed in full, since no later chunk covers their audio.
+        windows = decode_windows(speech_chunks, PARTIAL_WINDOW_SECONDS if STREAM_PARTIAL_SEGMENTS else DECODE_WINDOW_SECONDS)
+        # chunk_length is always passed, because model.transcribe keeps it in the feature extractor for later calls
+        chunk_length = audio_context_length(model, max(end - start for start, end in windows), reduced_context)
+        tick_start = time.perf_counter()
+        deferred = alignment_stats.defer() if alignment_stats is not None else DEFERRED_ALIGNMENT
+        # (window start, segment) tuples, segment times are relative to the start of their window
+        decoded_segments = []
+        for window_start, window_end in windows:
+            if decoded_segments and cancel is not None and not descriptor.final and cancel():
+                log_queue.put(f'{datetime.datetime.now().strftime("%H:%M:%S")}|{descriptor.chunk_id}|CANCELLED|segments={len(decoded_segments)}'
+                              f'|decoded_speech_seconds={window_start:.2f}|speech_seconds={windows[-1][1]:.2f}')
+                # Only the audio of the windows decoded is aligned
+                speech_audio = speech_audio[:int(window_start * MODEL_RATE)]
+                break
+            # Later windows continue from the text of the earlier ones, as model.transcribe does between its own windows
+            prompt = ((transcript.prompt() or '') + ''.join(segment.text for start, segment in decoded_segments))[-PROMPT_CHARACTERS:].strip() or None
+            segments, info = model.transcribe(speech_audio[int(window_start * MODEL_RATE):int(window_end * MODEL_RATE)], vad_filter=False,
+                                              word_timestamps=not deferred, initial_prompt=prompt, chunk_length=chunk_length,
+                                              **(decoding or {'beam_size': 5}))
+            # segments is a generator object that will use the whisper model autoregressively to generate text transcripts from the audio data provided in model.transcribe
+            for segment in segments:
+                decoded_segments.append((window_start, segment))
+                if STREAM_PARTIAL_SEGMENTS:
+                    output_queue.put(PartialSegment(datetime.datetime.now().strftime("%H:%M:%S"), segment.text, descriptor.stream_id,
+                                                    descriptor.chunk_id, len(decoded_segments) - 1))
+                    if len(decoded_segments) == 1:
+                        log_queue.put(f'{datetime.datetime.now().strftime("%H:%M:%S")}|{descriptor.chunk_id}|FIRST_PARTIAL'
+                                      f'|latency={time.time() - descriptor.captured_at:.3f}|windows={len(windows)}')
+        if deferred:
+            tokenizer = Tokenizer(model.hf_tokenizer, model.model.is_multilingual, task="transcribe", language="en")
+            text_tokens = [token for start, segment in decoded_segments for token in segment.tokens if token < tokenizer.eot]
+            words = split_words(tokenizer, text_tokens)
+
+            def aligner():
+                # The words are aligned in one pass over all of the speech decoded, not window by window
+                features = model.feature_extractor(speech_audio, chunk_length=audio_context_length(model, len(speech_audio) / MODEL_RATE, reduced_context))
+                num_frames = features.shape[-1] - model.feature_extractor.nb_max_frames
+                return align_words(model, tokenizer, text_tokens, pad_or_trim(features[:, :num_frames], model.feature_extractor.nb_max_frames),
+                                   num_frames, speech_chunks, alignment_stats)
+        else:
+            words = restore_word_times([(start + word.start, start + word.end, word.word) for start, segment in decoded_segments for word in segment.words],
+                                       speech_chunks)
+        if alignment_stats is not None:
+            alignment_stats.record_tick(time.perf_counter() - tick_start)
+    needs_times = update_transcript(descriptor, transcript, words, time_at, output_queue, buffer_prune_queue, log_queue, confirmer, aligner)
+    if speech_chunks and alignment_stats is not None:
+        alignment_stats.record_commit(needs_times, deferred)
+
+def update_transcript(descriptor, transcript, words, time_at, output_queue, buffer_prune_queue, log_queue, confirmer=None, aligner=None):
+    """
+    Confirm the words a chunk's transcription agrees on with the previous one, prune the audio buffer after them and send the update to the display process.
+
+    This is the LocalAgreement policy: the longest common prefix of two consecutive hypotheses is
+    committed, whether or not it ends a sentence. Words of the new hypothesis that lie in audio
+    committed already, or repeat the last committed words, are dropped first.
+
+    A final chunk, sent at the end of an utterance, commits every word of its hypothesis.
+
+    With deferred alignment the words come without times and aligner is only called when words are
+    about to be committed, since only the committed words and the prune position need them.
+
+    Args:
+        descriptor (ChunkDescriptor): The transcribed chunk.
+        transcript (StreamTranscript): Transcript state of the chunk's stream.
+        words (list): (start, end, word) tuples of the chunk, with times in seconds from the start of the chunk, or None times for aligner to fill in.
+        time_at (str): Time at which transcription of the chunk started.
+        output_queue (Queue): Queue for sending transcribed text segments to the display process.
+        buffer_prune_queue (Queue): Queue for sending pruning locations in the audio buffers.
+        log_queue (Queue): Queue for logging information.
+        confirmer (CascadeConfirmer, optional): In cascade mode, the confirm tier that the committed words are handed to
+            instead of being sent as confirmed text. Defaults to None.
+        aligner (callable, optional): Returns the words with their times, for words given without times. Defaults to None.
+
+    Returns:
+        bool: Whether the update committed words, so needed word times.
+    """
+    chunk_id = descriptor.chunk_id
+    chunk_start = descriptor.offset / MODEL_RATE
+
+    def agreement(hypothesis):
+        # Words ending before the committed time were confirmed by an earlier chunk, words without times (deferred
+        # alignment) can't be filtered yet, only the overlap with the last committed words catches them
+        hypothesis = [word for word in hypothesis if word[1] is None or word[1] > transcript.committed_time]
+        for overlap in range(min(COMMIT_OVERLAP_WORDS, len(transcript.committed_words), len(hypothesis)), 0, -1):
+            if [normalize_word(word) for word in transcript.committed_words[-overlap:]] == [normalize_word(word[2]) for word in hypothesis[:overlap]]:
+                hypothesis = hypothesis[overlap:]
+                break
+        agreed = 0
+        while (agreed < min(len(hypothesis), len(transcript.hypothesis))
+               and normalize_word(hypothesis[agreed][2]) == normalize_word(transcript.hypothesis[agreed][2])):
+            agreed += 1
+        return hypothesis, agreed
+
+    # Word times are made absolute, so hypotheses from chunks starting at different prune positions line up
+    hypothesis, agreed = agreement([(None if start is None else chunk_start + start, None if end is None else chunk_start + end, word)
+                                    for start, end, word in words])
+    # When the next chunk could outgrow MAX_BUFFER_SECONDS, every word up to the last one is committed without
+    # agreement, since the last word may be cut off by the end of the chunk. The audio before the kept word
+    # holds no unconfirmed words and is pruned, without words only the last second is kept.
+    chunk_seconds = descriptor.length / MODEL_RATE
+    force_commit = chunk_seconds > MAX_BUFFER_SECONDS - AUDIO_CHUNK_LENGTH
+    needs_times = bool(hypothesis) and bool(agreed or force_commit or descriptor.final)
+    if aligner is not None and needs_times:
+        # With times the words already committed by a chunk still in flight at the last prune are dropped as well
+        hypothesis, agreed = agreement([(chunk_start + start, chunk_start + end, word) for start, end, word in aligner()])
+
+    committed = hypothesis[:agreed]
+    transcript.hypothesis = hypothesis[agreed:]
+    prune_time = None
+    if descriptor.final:
+        # The chunk ends an utterance, nothing follows that could change its words, so all of them are
+        # confirmed and the whole chunk is pruned
+        final_words = transcript.hypothesis
+        committed += final_words
+        transcript.hypothesis = []
+        prune_time = chunk_start + chunk_seconds
+        log_queue.put(f'{datetime.datetime.now().strftime("%H:%M:%S")}|{chunk_id}|FINAL_COMMIT|words={len(final_words)}|chunk_seconds={chunk_seconds:.2f}')
+    elif force_commit:
+        forced = transcript.hypothesis[:-1]
+        committed += forced
+        transcript.hypothesis = transcript.hypothesis[-1:]
+        prune_time = transcript.hypothesis[0][0] if transcript.hypothesis else chunk_start + chunk_seconds - 1.0
+        log_queue.put(f'{datetime.datetime.now().strftime("%H:%M:%S")}|{chunk_id}|FORCED_COMMIT|words={len(forced)}|chunk_seconds={chunk_seconds:.2f}')
+
+    confirmed_transcript = ''.join(word for start, end, word in committed)
+    unconfirmed_transcript = ''.join(word for start, end, word in transcript.hypothesis)
+    if committed and confirmer is not None:
+        # The committed audio is copied before the prune is sent, the confirm tier's text replaces the draft when it is ready
+        confirmer.submit(descriptor, transcript, max(transcript.committed_time, chunk_start), committed[-1][1], confirmed_transcript)
+        confirmed_transcript = ''
+    if confirmer is not None:
+        transcript.unconfirmed_transcript = unconfirmed_transcript
+        unconfirmed_transcript = ''.join(transcript.pending_drafts) + unconfirmed_transcript
+    if committed:
+        transcript.commit(committed)
+        # The buffer is pruned right after the last committed word, so the next chunk only holds unconfirmed audio
+        prune_time = max(prune_time or 0, transcript.committed_time)
+        log_queue.put(f'{datetime.datetime.now().strftime("%H:%M:%S")}|{chunk_id}|COMMITTED|words={len(committed)}'
+                      f'|chunk_seconds={chunk_seconds:.2f}|committed_time={transcript.committed_time:.2f}')
+    if prune_time is not None:
+        transcript.committed_time = max(transcript.committed_time, prune_time)
+        buffer_prune_queue.put((descriptor.stream_id, int(prune_time * MODEL_RATE)))
+    
+    log_queue.put(f'{datetime.datetime.now().strftime("%H:%M:%S")}|{chunk_id}|TRANSCRIPT|{transcript.confirmed_transcript}{unconfirmed_transcript}')
+    # Only the newly confirmed text is sent, the display process appends it to what it has shown so far
+    output = TranscriptUpdate(str(time_at), confirmed_transcript, unconfirmed_transcript, descriptor.stream_id, chunk_id, prune_time)
+    output_queue.put(output)
+    transcript.record_latency(descriptor, log_queue)
+    return needs_times
+
+def normalize_word(word):
+    """
+    Normalize a word for comparing hypotheses, ignoring case, spacing and surrounding punctuation.
+
+    Args:
+        word (str): A word as transcribed, with its leading space.
+
+    Returns:
+        str: The normalized word.
+    """
+    return word.strip().strip(string.punctuation).lower()
+
+def decode_windows(speech_chunks, window_seconds=DECODE_WINDOW_SECONDS):
+    """
+    Split the collected speech of a chunk into model windows of at least window_seconds, except for the last one.
+
+    Windows only end where collect_chunks joined two speech regions, so no word is cut in two. A single speech region
+    longer than the window stays whole, model.transcribe then seeks through it as usual.
+
+    Args:
+        speech_chunks (list): Speech regions of the chunk as {'start': sample, 'end': sample} dicts.
+        window_seconds (float, optional): Shortest window. Defaults to DECODE_WINDOW_SECONDS.
+
+    Returns:
+        list: (start, end) tuples of each window in seconds of the collected speech.
+    """
+    windows = []
+    window_start = position = 0.0
+    for chunk in speech_chunks:
+        if position - window_start >= window_seconds:
+            windows.append((window_start, position))
+            window_start = position
+        position += (chunk['end'] - chunk['start']) / MODEL_RATE
+    return windows + [(window_start, position)]
+
+def chunk_speech_timestamps(descriptor, audio_data, vad_stats=None):
+    """
+    Get the speech regions of a chunk, from the capture VAD when they came with the chunk, otherwise by running the VAD over it.
+
+    Args:
+        descriptor (ChunkDescriptor): The chunk.
+        audio_data (ndarray): The chunk's audio.
+        vad_stats (VadStats, optional): Counters of the VAD work done and saved. Defaults to None.
+
+    Returns:
+        list: Speech chunks as get_speech_timestamps returns them, {'start': sample, 'end': sample} relative to the chunk.
+    """
+    if descriptor.speech_regions is not None:
+        if vad_stats is not None:
+            vad_stats.record_reused(descriptor.length / MODEL_RATE)
+        return [{'start': start, 'end': end} for start, end in descriptor.speech_regions]
+    vad_start = time.perf_counter()
+    speech_chunks = get_speech_timestamps(audio_data, VadOptions())
+    if vad_stats is not None:
+        vad_stats.record_run(descriptor.length / MODEL_RATE, time.perf_counter() - vad_start)
+    return speech_chunks
+
+def restore_word_times(words, speech_chunks):
+    """
+    Map word times from the collected speech audio back to the chunk.
+
+    Args:
+        words (list): (start, end, word) tuples with times in seconds of the collected speech audio.
+        speech_chunks (list): The speech chunks the audio was collected from.
+
+    Returns:
+        list: (start, end, word) tuples with times in seconds from the start of the chunk.
+    """
+    timestamps_map = SpeechTimestampsMap(speech_chunks, MODEL_RATE)
+    restored_words = []
+    for start, end, word in words:
+        chunk_index = timestamps_map.get_chunk_index((start + end) / 2)
+        restored_words.append((timestamps_map.get_original_time(start, chunk_index), timestamps_map.get_original_time(end, chunk_index), word))
+    return restored_words
+
+def transcribe_batch(model, audio_buffers, descriptors, transcripts, output_queue, buffer_prune_queue, log_queue, reduced_context=False,
+                     decoding=None, confirmer=None, vad_stats=None, alignment_stats=None):
+    """
+    Transcribe the chunks of several streams together and update each stream's transcript.
+
+    The speech of each chunk is collected and turned into features on its own, then the encoder, the decoder and
+    the word alignment each run once for the whole batch, or while alignment is deferred each chunk is aligned
+    on its own when it commits words. Chunks longer than one model window and
+    chunks whose decoding needs a temperature fallback go through transcribe_chunk instead.
+
+    Args:
+        model (WhisperModel): The model to transcribe with.
+        audio_buffers (dict): Mapped shared audio buffers by shared memory name.
+        descriptors (list): ChunkDescriptors of the chunks, at most one per stream.
+        transcripts (dict): StreamTranscripts by stream ID.
+        output_queue (Queue): Queue for sending transcribed text segments to the display process.
+        buffer_prune_queue (Queue): Queue for sending pruning locations in the audio buffers.
+        log_queue (Queue): Queue for logging information.
+        reduced_context (bool, optional): Whether to encode a context sized to the longest chunk of the batch. Defaults to False.
+        decoding (dict, optional): Decoding options, as for transcribe_chunk. Defaults to beam search with 5 beams.
+        confirmer (CascadeConfirmer, optional): Confirm tier of cascade mode. Defaults to None.
+        vad_stats (VadStats, optional): Counters of the VAD work done and saved. Defaults to None.
+        alignment_stats (AlignmentStats, optional): Timings of the transcription ticks and word alignments. Defaults to None.
+
+    Returns:
+        None
+    """
+    time_at = datetime.datetime.now().strftime("%H:%M:%S")
+    feature_extractor = model.feature_extractor
+    # The batch shares one encoder input shape, sized to its longest chunk
+    chunk_length = audio_context_length(model, max(descriptor.length for descriptor in descriptors) / MODEL_RATE, reduced_context)
+    batch = []
+    for descriptor in descriptors:
+        audio_buffer = audio_buffers[descriptor.buffer_name]
+        audio_data = audio_buffer.view(descriptor.offset, descriptor.offset + descriptor.length)
+        speech_chunks = chunk_speech_timestamps(descriptor, audio_data, vad_stats)
+        if not speech_chunks:
+            update_transcript(descriptor, transcripts[descriptor.stream_id], [], time_at, output_queue, buffer_prune_queue, log_queue, confirmer)
+            continue
+        features = feature_extractor(collect_chunks(audio_data, speech_chunks), chunk_length=chunk_length)
+        num_frames = features.shape[-1] - feature_extractor.nb_max_frames
+
+        # The features are a copy, so the shared audio only had to survive until here
+        if not audio_buffer.is_available(descriptor.offset):
+            log_queue.put(f'{datetime.datetime.now().strftime("%H:%M:%S")}|{descriptor.chunk_id}|CHUNK_OVERWRITTEN|{descriptor.sequence}')
+        elif num_frames > feature_extractor.nb_max_frames:
+            transcribe_chunk(model, audio_buffer, descriptor, transcripts[descriptor.stream_id], output_queue, buffer_prune_queue, log_queue,
+                             reduced_context, decoding, confirmer, vad_stats, alignment_stats)
+        else:
+            batch.append((descriptor, speech_chunks, pad_or_trim(features[:, :num_frames], feature_extractor.nb_max_frames), num_frames))
+    if not batch:
+        return
+
+    log_queue.put(f'{datetime.datetime.now().strftime("%H:%M:%S")}|BATCH|size={len(batch)}|' + ','.join(item[0].chunk_id for item in batch))
+    tick_start = time.perf_counter()
+    deferred = alignment_stats.defer() if alignment_stats is not None else DEFERRED_ALIGNMENT
+    batch_words = decode_batch(model, [item[2] for item in batch], [item[3] for item in batch],
+                               [transcripts[item[0].stream_id].prompt() for item in batch], (decoding or {}).get('beam_size', 5),
+                               align=not deferred)
+    if alignment_stats is not None:
+        alignment_stats.record_tick(time.perf_counter() - tick_start, len(batch))
+    tokenizer = Tokenizer(model.hf_tokenizer, model.model.is_multilingual, task="transcribe", language="en")
+    for (descriptor, speech_chunks, features, num_frames), words in zip(batch, batch_words):
+        if words is None:
+            transcribe_chunk(model, audio_buffers[descriptor.buffer_name], descriptor, transcripts[descriptor.stream_id],
+                             output_queue, buffer_prune_queue, log_queue, reduced_context, decoding, confirmer, vad_stats, alignment_stats)
+            continue
+        if deferred:
+            # Without alignment the batch returns text tokens, the chunk is aligned on its own if it commits words
+            aligner = functools.partial(align_words, model, tokenizer, words, features, num_frames, speech_chunks, alignment_stats)
+            needs_times = update_transcript(descriptor, transcripts[descriptor.stream_id], split_words(tokenizer, words), time_at,
+                                            output_queue, buffer_prune_queue, log_queue, confirmer, aligner)
+        else:
+            # Word times are mapped back from the VAD filtered audio to the chunk
+            needs_times = update_transcript(descriptor, transcripts[descriptor.stream_id], restore_word_times(words, speech_chunks), time_at,
+                                            output_queue, buffer_prune_queue, log_queue, confirmer)
+        if alignment_stats is not None:
+            alignment_stats.record_commit(needs_times, deferred)
+
+def decode_batch(model, features, num_frames, prompts=None, beam_size=5, align=True):
+    """
+    Run the encoder, beam search decoding and word alignment once for a batch of single-window features.
+
+    Decoding uses the settings model.transcribe uses for its first temperature. Results that model.transcribe
+    would retry at a higher temperature are returned as None.
+
+    Args:
+        model (WhisperModel): The model to transcribe with.
+        features (list): Log-Mel features padded to one model window, one per chunk.
+        num_frames (list): Number of feature frames holding audio, one per chunk.
+        prompts (list, optional): Initial prompt text or None, one per chunk. Defaults to None.
+        beam_size (int, optional): Beam size of the decoder, 1 is greedy decoding. Defaults to 5.
+        align (bool, optional): Whether to align the words, otherwise the text tokens are returned. Defaults to True.
+
+    Returns:
+        list: (start, end, word) tuples per chunk with times in seconds, or the text tokens per chunk without alignment,
+            or None for chunks that need a fallback.
+    """
+    tokenizer = Tokenizer(model.hf_tokenizer, model.model.is_multilingual, task="transcribe", language="en")
+    encoder_output = model.model.encode(get_ctranslate2_storage(np.stack(features)), to_cpu=False)
+    prompts = [model.get_prompt(tokenizer, tokenizer.encode(" " + prompt) if prompt else []) for prompt in prompts or [None] * len(features)]
+    results = model.model.generate(encoder_output, prompts, beam_size=beam_size, patience=1, length_penalty=1,
+                                   max_length=model.max_length, return_scores=True, return_no_speech_prob=True,
+                                   suppress_blank=True, suppress_tokens=get_suppressed_tokens(tokenizer, [-1]),
+                                   max_initial_timestamp_index=int(round(1.0 / model.time_precision)))
+
+    # The thresholds are the model.transcribe defaults
+    batch_tokens = []
+    for result in results:
+        tokens = result.sequences_ids[0]
+        avg_logprob = result.scores[0] * len(tokens) / (len(tokens) + 1)
+        if result.no_speech_prob > 0.6 and avg_logprob < -1.0:
+            batch_tokens.append([])
+        elif get_compression_ratio(tokenizer.decode(tokens).strip()) > 2.4 or avg_logprob < -1.0:
+            batch_tokens.append(None)
+        else:
+            batch_tokens.append([token for token in tokens if token < tokenizer.eot])
+
+    aligned = [i for i, tokens in enumerate(batch_tokens) if tokens]
+    if not aligned or not align:
+        return batch_tokens
+    # Chunks without text are left out of the alignment, which needs the encoder output of the remaining ones only
+    if len(aligned) < len(features):
+        encoder_output = get_ctranslate2_storage(np.array(encoder_output)[aligned])
+    alignments = model.model.align(encoder_output, tokenizer.sot_sequence, [batch_tokens[i] for i in aligned],
+                                   [num_frames[i] for i in aligned], median_filter_width=7)
+
+    batch_words = list(batch_tokens)
+    for i, alignment in zip(aligned, alignments):
+        batch_words[i] = alignment_words(model, tokenizer, batch_tokens[i], alignment)
+    return batch_words
+
+def alignment_words(model, tokenizer, text_tokens, alignment):
+    """
+    Turn the token alignment of one chunk into timed words, like WhisperModel.find_alignment followed by punctuation merging.
+
+    Args:
+        model (WhisperModel): The model that produced the alignment.
+        tokenizer (Tokenizer): The tokenizer of the model.
+        text_tokens (list): Text tokens of the chunk.
+        alignment (WhisperAlignmentResult): The alignment of the text tokens.
+
+    Returns:
+        list: (start, end, word) tuples with times in seconds.
+    """
+    text_indices = np.array([pair[0] for pair in alignment.alignments])
+    time_indices = np.array([pair[1] for pair in alignment.alignments])
+    words, word_tokens = tokenizer.split_to_word_tokens(text_tokens + [tokenizer.eot])
+    if len(word_tokens) <= 1:
+        return []
+    word_boundaries = np.pad(np.cumsum([len(tokens) for tokens in word_tokens[:-1]]), (1, 0))
+
+    jumps = np.pad(np.diff(text_indices), (1, 0), constant_values=1).astype(bool)
+    jump_times = np.round(time_indices[jumps] / model.tokens_per_second, 2)
+    return split_words(tokenizer, text_tokens, jump_times[word_boundaries[:-1]].tolist(), jump_times[word_boundaries[1:]].tolist())
+
+def split_words(tokenizer, text_tokens, starts=None, ends=None):
+    """
+    Split text tokens into words the way the word alignment does, with punctuation merged into the neighbouring words.
+
+    Args:
+        tokenizer (Tokenizer): The tokenizer of the model.
+        text_tokens (list): Text tokens of the chunk.
+        starts (list, optional): Start time of each word before merging. Defaults to None, the words get no times.
+        ends (list, optional): End time of each word before merging. Defaults to None.
+
+    Returns:
+        list: (start, end, word) tuples, with None times when no times were given.
+    """
+    words, word_tokens = tokenizer.split_to_word_tokens(text_tokens + [tokenizer.eot])
+    if len(word_tokens) <= 1:
+        return []
+    if starts is None:
+        starts = ends = [None] * (len(words) - 1)
+    timings = [dict(word=word, tokens=tokens, start=start, end=end) for word, tokens, start, end in zip(words[:-1], word_tokens[:-1], starts, ends)]
+    merge_punctuations(timings, "\"'“¿([{-", "\"'.。,，!！?？:：”)]}、")
+    return [(timing["start"], timing["end"], timing["word"]) for timing in timings if timing["word"]]
+
+def align_words(model, tokenizer, text_tokens, features, num_frames, speech_chunks, alignment_stats=None):
+    """
+    Align the text of a chunk transcribed without word timestamps, for deferred alignment.
+
+    The chunk's features are encoded again, which only costs less than aligning every transcription while few
+    ticks commit words, see AlignmentStats.defer.
+
+    Args:
+        model (WhisperModel): The model the chunk was transcribed with.
+        tokenizer (Tokenizer): The tokenizer of the model.
+        text_tokens (list): Text tokens of the chunk.
+        features (ndarray): Log-Mel features of the chunk's speech, padded to one model window.
+        num_frames (int): Number of feature frames holding audio.
+        speech_chunks (list): The speech chunks the audio was collected from.
+        alignment_stats (AlignmentStats, optional): Timings of the transcription ticks and word alignments. Defaults to None.
+
+    Returns:
+        list: (start, end, word) tuples with times in seconds from the start of the chunk, in the order of split_words.
+    """
+    align_start = time.perf_counter()
+    encoder_output = model.model.encode(get_ctranslate2_storage(features[None]), to_cpu=False)
+    alignment = model.model.align(encoder_output, tokenizer.sot_sequence, [text_tokens], [num_frames], median_filter_width=7)[0]
+    words = restore_word_times(alignment_words(model, tokenizer, text_tokens, alignment), speech_chunks)
+    if alignment_stats is not None:
+        alignment_stats.record_alignment(time.perf_counter() - align_start)
+    return words
+
+def audio_context_length(model, seconds, reduced_context):
+    """
+    Choose the length of the audio context the encoder runs over.
+
+    Args:
+        model (WhisperModel): The model to transcribe with.
+        seconds (float): Length of the audio to transcribe.
+        reduced_context (bool): Whether to size the context to the audio.
+
+    Returns:
+        int: Context length in seconds, rounded up to AUDIO_CONTEXT_STEP and at most the model's full window.
+    """
+    full_length = model.feature_extractor.chunk_length
+    if not reduced_context:
+        return full_length
+    return min(full_length, AUDIO_CONTEXT_STEP * max(1, math.ceil(seconds / AUDIO_CONTEXT_STEP)))
+
+def supports_reduced_context(model, log_queue):
+    """
+    Check whether the CTranslate2 encoder of the model accepts an audio context shorter than the full window.
+
+    Stock CTranslate2 builds only accept full 30 s windows and reject shorter inputs with a ValueError.
 
-        # segments is a generator object that will use the whisper model autoregressively to generate text transcripts from the audio data provided in model.transcribe
+    Args:
+        model (WhisperModel): The model to check.
+        log_queue (Queue): Queue for logging information.
+
+    Returns:
+        bool: True if reduced contexts can be used.
+    """
+    try:
+        segments, info = model.transcribe(np.zeros(MODEL_RATE, dtype=np.float32), vad_filter=False, chunk_length=AUDIO_CONTEXT_STEP)
         for segment in segments:
-            for word in segment.words:
-                if "." in word.word or "?" in word.word or "!" in word.word or "..." in word.word:
-                    num_sentences += 1
-                    words_list.append((word.start, word.end, word.word, True))
-                else:
-                    words_list.append((word.start, word.end, word.word, False))
-        
-        # confirmed_signal tells the program where to prune the audio buffer
-        confirmed_signal = 0
-        
-        print(f'num_sentences: {num_sentences}')
-        
-        # prune all but the last full sentence and all words afterwards, and calculate the timestamp in the audio buffer of this pruning location
-        if num_sentences == 2 and words_list[-1][3] == False or num_sentences > 2:
-            prune_prime = False
-            # Backward loop through words_list to find the index of the end of the second last full sentence
-            for i in range(len(words_list)-1, -1, -1):
-                word_tuple = words_list[i]
-                if word_tuple[3] == True: 
-                    if prune_prime == True:
-                        confirmed_signal = i
-                        buffer_prune_queue.put(word_tuple[1])
-                        break
-                    prune_prime = True
-
-            # Forward loop through words_list to create the confirmed transcript        
-            for j in range(confirmed_signal+1):
-                confirmed_transcript += words_list[j][2]
-
-        # Forward loop through words_list to create the unconfirmed transcript (executes regardless of num sentences)
-        for k in range(confirmed_signal, len(words_list)):
-            unconfirmed_transcript += words_list[k][2]
-        
-        log_queue.put(f'{datetime.datetime.now().strftime("%H:%M:%S")}|{chunk_id}|TRANSCRIPT|{confirmed_transcript}{unconfirmed_transcript}')
-        output = (str(time_at), confirmed_transcript, unconfirmed_transcript)
-        output_queue.put(output)
+            pass
+        return True
+    except ValueError as error:
+        log_queue.put(f'{datetime.datetime.now().strftime("%H:%M:%S")}|REDUCED_CONTEXT_UNSUPPORTED|{error}')
+        return False
 
-def initialize_model(log_queue, size="tiny.en"):
+def initialize_model(log_queue, size="tiny.en", cpu_threads=0, num_workers=1):
     """
     Initializes a WhisperModel object with the specified size.
 
     Args:
         log_queue (Queue): A queue to store log messages.
         size (str, optional): The size of the model. Defaults to "tiny.en".
+        cpu_threads (int, optional): Number of CTranslate2 threads, 0 for the CTranslate2 default. Defaults to 0.
+        num_workers (int, optional): Number of CTranslate2 translators that can run in parallel. Defaults to 1.
 
     Returns:
         WhisperModel: The initialized WhisperModel object.
@@ -140,15 +956,113 @@ def initialize_model(log_queue, size="tiny.en"):
     # or run on GPU with INT8
     # model = WhisperModel(model_size, device="cuda", compute_type="int8_float16")
     # or run on CPU with INT8
-    model = WhisperModel(model_size, device="cpu", compute_type="int8")
-    log_queue.put(f'{datetime.datetime.now().strftime("%H:%M:%S")}|INITIALIZED_MODEL|{model_size}')
+    model = WhisperModel(model_size, device="cpu", compute_type="int8", cpu_threads=cpu_threads, num_workers=num_workers)
+    log_queue.put(f'{datetime.datetime.now().strftime("%H:%M:%S")}|INITIALIZED_MODEL|{model_size}|cpu_threads={cpu_threads}|num_workers={num_workers}')
 
     return model
 
+def run_startup_stage(stage_seconds, stage, function, *args, **kwargs):
+    """
+    Run one stage of a worker's startup and record how long it took.
+
+    Args:
+        stage_seconds (dict): Seconds taken by each stage, by stage name.
+        stage (str): Name of the stage.
+        function (callable): The stage, called with the remaining arguments.
+
+    Returns:
+        The result of function.
+    """
+    stage_start = time.perf_counter()
+    result = function(*args, **kwargs)
+    stage_seconds[stage] = time.perf_counter() - stage_start
+    return result
+
+def warm_up_model(model):
+    """
+    Transcribe a second of noise with word timestamps, so CTranslate2's lazy initialization of the encoder,
+    the decoder and the alignment heads happens before the first chunk.
+
+    Args:
+        model (WhisperModel): The model to warm up.
+
+    Returns:
+        None
+    """
+    noise = (np.random.default_rng(0).standard_normal(MODEL_RATE) * 0.01).astype(np.float32)
+    segments, info = model.transcribe(noise, beam_size=5, vad_filter=False, word_timestamps=True)
+    for segment in segments:
+        pass
+
+def warm_up_tokenizer(model):
+    """
+    Build the tokenizer model_server decodes with and encode a prompt, so the tokenizer's caches are filled before the first chunk.
+
+    Args:
+        model (WhisperModel): The model whose tokenizer to warm up.
+
+    Returns:
+        Tokenizer: The tokenizer.
+    """
+    tokenizer = Tokenizer(model.hf_tokenizer, model.model.is_multilingual, task="transcribe", language="en")
+    tokenizer.encode(" Warming up the tokenizer.")
+    return tokenizer
+
+def warm_up_vad():
+    """
+    Create the shared VAD session of model_server and run it over a second of noise.
+
+    Returns:
+        None
+    """
+    get_vad_session()
+    get_speech_timestamps((np.random.default_rng(0).standard_normal(MODEL_RATE) * 0.01).astype(np.float32), VadOptions())
+
+def warm_up_streaming_vad():
+    """
+    Run the shared VAD session of the capture process over a second of noise, so the first audio captured does not
+    pay for its lazy initialization. A StreamingVad of its own is used, the state of the streams' VADs is untouched.
+
+    Returns:
+        None
+    """
+    noise = (np.random.default_rng(0).standard_normal(MODEL_RATE) * 0.01).astype(np.float32)
+    StreamingVad(VadOptions(threshold=VAD_THRESHOLD, window_size_samples=VAD_WINDOW)).process(noise)
+
+@functools.lru_cache
+def get_vad_session(num_threads=VAD_THREADS):
+    """
+    Creates the Silero VAD ONNX session shared by every VAD user in the current process.
+
+    The session also replaces the one held by faster_whisper's cached VAD model, so
+    get_speech_timestamps and model.transcribe(vad_filter=True) run on the same tuned session.
+
+    Args:
+        num_threads (int, optional): Number of intra-op threads. Defaults to VAD_THREADS.
+
+    Returns:
+        InferenceSession: The shared onnxruntime session.
+    """
+    import onnxruntime
+
+    opts = onnxruntime.SessionOptions()
+    opts.intra_op_num_threads = num_threads
+    opts.inter_op_num_threads = 1
+    opts.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+    opts.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    # Idle threads would otherwise spin between the short VAD calls and steal cycles from whisper
+    opts.add_session_config_entry("session.intra_op.allow_spinning", "0")
+    opts.log_severity_level = 4
+
+    session = onnxruntime.InferenceSession(os.path.join(get_assets_path(), "silero_vad.onnx"),
+                                           providers=["CPUExecutionProvider"], sess_options=opts)
+    get_vad_model().session = session
+    return session
+
 
 def output_transcript(output_queue, session_id):
     """
-    Writes the transcripts to a file.
+    Writes the transcripts to a file, one file per capture stream.
 
     Args:
         output_queue (Queue): The queue containing the text data.
@@ -157,33 +1071,42 @@ def output_transcript(output_queue, session_id):
     Returns:
         None
     """
-    
+    # Stopped by the None sent at shutdown, after the last transcript updates, not by Ctrl+C
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
     #Create directory for storing transcripts
     session_directory = session_id
-    session_file = os.path.join(session_directory, 'transcript.txt')
 
     # Check if the directory exists, and create it if it does not
     if not os.path.exists(session_directory):
         os.makedirs(session_directory)
     
+    # Latest unconfirmed transcript of each stream, written out when the session ends
+    unconfirmed_transcripts = {}
     while True:
         text_data = output_queue.get()
         
         if text_data is None:
-            with open(session_file, "a") as transcript_file:
-                transcript_file.write(unconfirmed_transcript)  
-                transcript_file.close()
+            for stream_id, unconfirmed_transcript in unconfirmed_transcripts.items():
+                with open(os.path.join(session_directory, f'transcript_{stream_id}.txt'), "a") as transcript_file:
+                    transcript_file.write(unconfirmed_transcript)  
+                    transcript_file.close()
             print("\nDisplay process terminated.")
             break
 
+        if isinstance(text_data, PartialSegment):
+            print(f'Stream {text_data.stream_id} partial segment {text_data.segment}: {text_data.text}')
+            continue
+
         confirmed_transcript = text_data[1]
-        unconfirmed_transcript = text_data[2]
+        stream_id = text_data[3]
+        unconfirmed_transcripts[stream_id] = text_data[2]
 
-        with open(session_file, "a") as transcript_file:
+        with open(os.path.join(session_directory, f'transcript_{stream_id}.txt'), "a") as transcript_file:
             transcript_file.write(confirmed_transcript)  # Write the log data to the file
         transcript_file.close()
 
-        print(f'Confirmed transcript: \n {text_data[1]} \n' 
+        print(f'Stream {stream_id} confirmed transcript: \n {text_data[1]} \n' 
             f'Unconfirmed transcript: \n {text_data[2]} \n Last Updated: {text_data[0]} \n'
             f'############################################################################################################################# \n')
 
@@ -199,7 +1122,9 @@ def output_to_window(output_queue):
     Args:
         output_queue (Queue): A queue containing the transcript data to be displayed.
     """
-    
+    # Stopped by the None sent at shutdown, after the last transcript updates, not by Ctrl+C
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
     root = tk.Tk()
     root.title("Tabletop Assistant")
     root.geometry("800x600")
@@ -217,6 +1142,16 @@ def output_to_window(output_queue):
         if text_data is None:
             print("\nDisplay process terminated.")
             break
+
+        # Partial segments are shown as unconfirmed text until the chunk's transcript update replaces them
+        if isinstance(text_data, PartialSegment):
+            if text_data.segment == 0:
+                unconfirmed_text_box.delete("1.0", tk.END)
+            unconfirmed_text_box.insert(tk.END, text_data.text)
+            unconfirmed_text_box.see(tk.END)
+            root.update_idletasks()
+            root.update()
+            continue
         
         timestamp, confirmed_transcript, unconfirmed_transcript = text_data[0], text_data[1], text_data[2]
         
@@ -245,6 +1180,8 @@ def logger(log_queue, repository_path):
     Returns:
         None
     """
+    # The logger runs until the None sent at shutdown, so it still writes the summaries logged after a Ctrl+C
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
     session_file = f'{repository_path}/session_log_{datetime.datetime.now().strftime("%Y-%m-%d_%H:%M:%S")}_{uuid.uuid4()}.txt'
     while True:
         log_data = log_queue.get()
@@ -259,131 +1196,2105 @@ def logger(log_queue, repository_path):
 
 ###############################################################################################
 
+#- Transcription classes -#
+
+class FairScheduler:
+    """
+    Holds the pending chunk descriptor of each stream and serves the streams round-robin.
+
+    Every chunk covers all unconfirmed audio of its stream, from the audio buffer's read cursor up to
+    the time it was sent, so a newer chunk supersedes any chunk of the same stream still waiting.
+    Only the latest chunk of each stream is kept, which bounds the work queued per stream to one
+    transcription however far model_server falls behind. Streams are served in the order they first
+    appeared, skipping those with nothing pending. Final chunks are the exception: they are never
+    coalesced, since the capture may have pruned their utterance before the newer chunk was sent.
+    """
+
+    def __init__(self):
+        self.pending = {}
+        # Final chunks of each stream waiting ahead of its pending chunk, oldest first
+        self.finals = {}
+        self.order = []
+        self.turn = 0
+        # Streams being handed over to this worker, their chunks are held until the transcript arrives
+        self.held = set()
+        # Workers that held streams were released to before their transcript arrived, by stream ID
+        self.forwards = {}
+        self.received = 0
+        self.coalesced = 0
+        # Transcriptions stopped early because a newer chunk of their stream arrived
+        self.cancelled = 0
+        self.max_depth = 0
+        self.max_staleness = 0.0
+
+    def __len__(self):
+        # Streams with work rather than chunks, so a batch of up to this many chunks takes each stream once
+        return sum(descriptor is not None or bool(self.finals.get(stream_id)) for stream_id, descriptor in self.pending.items()
+                   if stream_id not in self.held)
+
+    def add(self, descriptor):
+        """
+        Queue a chunk, replacing the pending chunk of its stream unless that one is final.
+
+        Args:
+            descriptor (ChunkDescriptor): The new chunk.
+
+        Returns:
+            ChunkDescriptor: The superseded chunk, or None.
+        """
+        if descriptor.stream_id not in self.pending:
+            self.order.append(descriptor.stream_id)
+        superseded = self.pending.get(descriptor.stream_id)
+        if superseded is not None and superseded.final:
+            self.finals.setdefault(descriptor.stream_id, collections.deque()).append(superseded)
+            superseded = None
+        self.pending[descriptor.stream_id] = descriptor
+        self.received += 1
+        if superseded is not None:
+            self.coalesced += 1
+        return superseded
+
+    def next(self):
+        """
+        Returns:
+            ChunkDescriptor: The oldest final chunk or else the pending chunk of the next stream in turn that has one.
+        """
+        for _ in range(len(self.order)):
+            stream_id = self.order[self.turn % len(self.order)]
+            self.turn += 1
+            if stream_id in self.held:
+                continue
+            if self.finals.get(stream_id):
+                return self.finals[stream_id].popleft()
+            if self.pending[stream_id] is not None:
+                descriptor = self.pending[stream_id]
+                self.pending[stream_id] = None
+                return descriptor
+        raise IndexError('no pending chunks')
+
+    def superseded(self, descriptor):
+        """
+        Returns:
+            bool: True if a newer chunk of the descriptor's stream is pending.
+        """
+        pending = self.pending.get(descriptor.stream_id)
+        return pending is not None and pending.sequence > descriptor.sequence
+
+    def hold(self, stream_id):
+        if stream_id not in self.pending:
+            self.order.append(stream_id)
+            self.pending[stream_id] = None
+        self.held.add(stream_id)
+
+    def remove(self, stream_id):
+        """
+        Stop serving a stream.
+
+        Returns:
+            tuple: The final chunks waiting for the stream, and its pending chunk or None.
+        """
+        if stream_id not in self.pending:
+            return (), None
+        self.order.remove(stream_id)
+        self.held.discard(stream_id)
+        return tuple(self.finals.pop(stream_id, ())), self.pending.pop(stream_id)
+
+    def adopt(self, stream_id, descriptor, finals=()):
+        """
+        Resume serving a held stream, with the pending chunk handed over by its previous worker unless a newer one already arrived.
+
+        Args:
+            stream_id (int): ID of the stream.
+            descriptor (ChunkDescriptor): The pending chunk from the previous worker, or None.
+            finals (tuple): The final chunks still waiting at the previous worker, they are older than any chunk held here.
+
+        Returns:
+            None
+        """
+        self.hold(stream_id)
+        self.held.discard(stream_id)
+        pending = self.pending[stream_id]
+        finals = collections.deque(finals)
+        if descriptor is not None and (pending is None or pending.sequence < descriptor.sequence):
+            self.pending[stream_id] = descriptor
+        elif descriptor is not None and descriptor.final:
+            finals.append(descriptor)
+        finals.extend(self.finals.get(stream_id, ()))
+        if finals:
+            self.finals[stream_id] = finals
+
+    def log_dispatch(self, descriptor, log_queue):
+        """
+        Log the queue depth and the staleness of a chunk as it is handed to the model.
+
+        Args:
+            descriptor (ChunkDescriptor): The chunk returned by next.
+            log_queue (Queue): Queue for logging information.
+
+        Returns:
+            None
+        """
+        depth = len(self) + 1
+        staleness = time.time() - descriptor.captured_at
+        self.max_depth = max(self.max_depth, depth)
+        self.max_staleness = max(self.max_staleness, staleness)
+        log_queue.put(f'{datetime.datetime.now().strftime("%H:%M:%S")}|{descriptor.chunk_id}|SCHEDULED|stream={descriptor.stream_id}'
+                      f'|depth={depth}|staleness={staleness:.3f}')
+
+    def log_summary(self, log_queue):
+        log_queue.put(f'{datetime.datetime.now().strftime("%H:%M:%S")}|SCHEDULER_SUMMARY|received={self.received}|coalesced={self.coalesced}'
+                      f'|cancelled={self.cancelled}|max_depth={self.max_depth}|max_staleness={self.max_staleness:.3f}')
+
+class WorkerControl(NamedTuple):
+    """
+    Control message sent to a model_server worker on its input queue, in place of a chunk.
+
+    Attributes:
+        action (str): 'expect', 'release' or 'adopt', see handle_control.
+        stream_id (int): ID of the stream being handed over.
+        target (int): For 'release', the index of the worker taking the stream over.
+        transcript (StreamTranscript): For 'adopt', the transcript state of the stream, or None.
+        descriptor (ChunkDescriptor): For 'adopt', the chunk still pending at the old worker, or None.
+        finals (tuple): For 'adopt', the final chunks still waiting at the old worker.
+    """
+    action: str
+    stream_id: int
+    target: int = 0
+    transcript: object = None
+    descriptor: object = None
+    finals: tuple = ()
+
+class TranscriptUpdate(NamedTuple):
+    """
+    Transcript update of a stream sent to the display process, closing the transcription of a chunk.
+
+    Attributes:
+        time_at (str): Time at which transcription of the chunk started.
+        confirmed_transcript (str): Newly confirmed text, to be appended to the text confirmed so far.
+        unconfirmed_transcript (str): The whole unconfirmed text, replacing the previous one.
+        stream_id (int): ID of the stream.
+        chunk_id (str): ID of the transcribed chunk, None for messages not tied to a chunk.
+        prune_time (float): Absolute seconds up to which the stream's audio buffer was pruned, None if it was not.
+    """
+    time_at: str
+    confirmed_transcript: str
+    unconfirmed_transcript: str
+    stream_id: int
+    chunk_id: str = None
+    prune_time: float = None
+
+class PartialSegment(NamedTuple):
+    """
+    Segment of a chunk sent to the display process as soon as it is decoded, with STREAM_PARTIAL_SEGMENTS.
+
+    Attributes:
+        time_at (str): Time at which the segment was decoded.
+        text (str): Text of the segment.
+        stream_id (int): ID of the stream.
+        chunk_id (str): ID of the chunk being transcribed, its TranscriptUpdate follows the last segment.
+        segment (int): Number of the segment within the chunk, starting at 0.
+    """
+    time_at: str
+    text: str
+    stream_id: int
+    chunk_id: str
+    segment: int
+
+class WorkerPool:
+    """
+    Runs WORKER_COUNT model_server processes and routes each stream's chunks to one of them.
+
+    A stream is assigned to the worker with the fewest streams when its first chunk arrives and keeps
+    that worker, so its transcript state stays in one process. Workers report the time they spend on
+    each stream, and every REBALANCE_INTERVAL seconds the busiest stream that narrows the gap is moved
+    from the most to the least loaded worker when their busy fractions differ by more than REBALANCE_THRESHOLD.
+    The pool is used in place of the input queue, its put method routes a ChunkDescriptor.
+
+    Args:
+        output_queue (Queue): Queue for sending transcribed text segments to the display process.
+        buffer_prune_queue (Queue): Queue for sending prune positions back to the recording program.
+        log_queue (Queue): Queue for logging information.
+        worker_count (int, optional): Number of workers. Defaults to WORKER_COUNT.
+    """
+
+    def __init__(self, output_queue, buffer_prune_queue, log_queue, worker_count=WORKER_COUNT):
+        self.log_queue = log_queue
+        self.queues = [multiprocessing.Queue() for _ in range(worker_count)]
+        self.load_queue = multiprocessing.Queue()
+        self.ready_queue = multiprocessing.Queue()
+        # Set by start_recording, the workers time their first transcript from it
+        self.recording_started = multiprocessing.Value('d', 0.0)
+        self.processes = [multiprocessing.Process(target=model_server, args=(worker_queue, output_queue, buffer_prune_queue, log_queue,
+                                                                             worker_id, self.queues, self.load_queue, self.ready_queue,
+                                                                             self.recording_started))
+                          for worker_id, worker_queue in enumerate(self.queues)]
+        # Worker index by stream ID, and seconds spent transcribing each stream since the last rebalance
+        self.assignments = {}
+        self.busy = collections.defaultdict(float)
+        # Sequence of the latest chunk of each stream a worker has transcribed, the chunks before it are done or superseded
+        self.transcribed = {}
+        self.rebalance_time = time.perf_counter()
+        # Busy fraction of each worker over the last REBALANCE_INTERVAL
+        self.worker_loads = [0.0] * worker_count
+
+    def start(self):
+        for process in self.processes:
+            process.start()
+
+    def wait_ready(self):
+        """
+        Wait until every worker has loaded and warmed up its models.
+
+        Returns:
+            dict: Seconds taken by each startup stage, by stage name, of the slowest worker.
+
+        Raises:
+            RuntimeError: If a worker exited before it was ready.
+        """
+        ready = {}
+        while len(ready) < len(self.processes):
+            try:
+                worker_id, stage_seconds = self.ready_queue.get(timeout=1)
+                ready[worker_id] = stage_seconds
+            except queue.Empty:
+                if not all(process.is_alive() for process in self.processes):
+                    raise RuntimeError('A transcription worker exited during startup')
+        return max(ready.values(), key=lambda stage_seconds: stage_seconds['total'])
+
+    def start_recording(self):
+        self.recording_started.value = time.time()
+
+    def put(self, descriptor):
+        if descriptor.stream_id not in self.assignments:
+            stream_counts = [0] * len(self.queues)
+            for worker_id in self.assignments.values():
+                stream_counts[worker_id] += 1
+            self.assignments[descriptor.stream_id] = stream_counts.index(min(stream_counts))
+        self.queues[self.assignments[descriptor.stream_id]].put(descriptor)
+
+    def rebalance(self):
+        """
+        Collect the load reports of the workers and move a stream when they are unevenly loaded.
+
+        Returns:
+            None
+        """
+        while not self.load_queue.empty():
+            stream_id, busy_seconds, sequence = self.load_queue.get()
+            self.busy[stream_id] += busy_seconds
+            self.transcribed[stream_id] = max(self.transcribed.get(stream_id, -1), sequence)
+        elapsed = time.perf_counter() - self.rebalance_time
+        if elapsed < REBALANCE_INTERVAL:
+            return
+        self.rebalance_time += elapsed
+
+        stream_loads = {stream_id: self.busy[stream_id] / elapsed for stream_id in self.assignments}
+        self.busy.clear()
+        worker_loads = [0.0] * len(self.queues)
+        for stream_id, worker_id in self.assignments.items():
+            worker_loads[worker_id] += stream_loads[stream_id]
+        self.worker_loads = worker_loads
+        busiest = worker_loads.index(max(worker_loads))
+        idlest = worker_loads.index(min(worker_loads))
+        gap = worker_loads[busiest] - worker_loads[idlest]
+        if gap <= REBALANCE_THRESHOLD:
+            return
+        # Moving a stream with a load below the gap narrows it, the largest such stream narrows it most
+        candidates = [stream_id for stream_id, worker_id in self.assignments.items() if worker_id == busiest and stream_loads[stream_id] < gap]
+        if candidates:
+            self.migrate(max(candidates, key=stream_loads.get), idlest)
+        self.log_queue.put(f'{datetime.datetime.now().strftime("%H:%M:%S")}|WORKER_LOADS|' + '|'.join(f'{load:.3f}' for load in worker_loads))
+
+    def load(self, stream_id):
+        """
+        Returns:
+            float: Busy fraction over the last REBALANCE_INTERVAL of the worker serving the stream.
+        """
+        return self.worker_loads[self.assignments.get(stream_id, 0)]
+
+    def migrate(self, stream_id, target):
+        """
+        Hand a stream over to another worker. Chunks sent afterwards go to the new worker, which holds them until the old one hands over the transcript.
+
+        Args:
+            stream_id (int): ID of the stream.
+            target (int): Index of the worker taking the stream over.
+
+        Returns:
+            None
+        """
+        source = self.assignments[stream_id]
+        self.queues[target].put(WorkerControl('expect', stream_id))
+        self.queues[source].put(WorkerControl('release', stream_id, target))
+        self.assignments[stream_id] = target
+        self.log_queue.put(f'{datetime.datetime.now().strftime("%H:%M:%S")}|MIGRATED_STREAM|stream={stream_id}|from={source}|to={target}')
+
+    def close(self):
+        """
+        Signal every worker to shut down and wait until they have transcribed the chunks already queued.
+
+        Returns:
+            None
+        """
+        for worker_queue in self.queues:
+            worker_queue.put(None)
+        for process in self.processes:
+            process.join()
+
+class StreamTranscript:
+    """
+    Transcript state kept by model_server for one capture stream.
+
+    Args:
+        stream_id (int): ID of the capture stream.
+    """
+
+    def __init__(self, stream_id):
+        self.stream_id = stream_id
+        self.confirmed_transcript = ''
+        # Unconfirmed (start, end, word) tuples of the last hypothesis, in absolute seconds
+        self.hypothesis = []
+        # End of the last committed word in absolute seconds, and the last few committed words
+        self.committed_time = 0.0
+        self.committed_words = []
+        # In cascade mode: drafts of committed words waiting for the confirm tier, the text it confirmed,
+        # and the latest unconfirmed draft
+        self.pending_drafts = collections.deque()
+        # The committed span not yet sent to the confirm tier, as (last descriptor, start time, end time, number of
+        # drafts at the end of pending_drafts it covers), or None
+        self.cascade_span = None
+        self.cascade_transcript = ''
+        self.unconfirmed_transcript = ''
+        # Seconds from the end of each chunk's capture to its transcript being sent
+        self.latencies = []
+
+    def commit(self, words):
+        """
+        Append agreed words to the confirmed transcript.
+
+        Args:
+            words (list): (start, end, word) tuples in absolute seconds.
+
+        Returns:
+            None
+        """
+        self.confirmed_transcript += ''.join(word for start, end, word in words)
+        self.committed_time = words[-1][1]
+        self.committed_words = (self.committed_words + [word for start, end, word in words])[-COMMIT_OVERLAP_WORDS:]
+
+    def prompt(self):
+        """
+        Returns:
+            str: The end of the confirmed transcript, passed to the model as context for the unconfirmed audio, or None.
+        """
+        return self.confirmed_transcript[-PROMPT_CHARACTERS:].strip() or None
+
+    def record_latency(self, descriptor, log_queue):
+        latency = time.time() - descriptor.captured_at
+        self.latencies.append(latency)
+        log_queue.put(f'{datetime.datetime.now().strftime("%H:%M:%S")}|{descriptor.chunk_id}|LATENCY|stream={self.stream_id}|{latency:.3f}')
+
+    def log_latency_summary(self, log_queue):
+        """
+        Log and print the latency the shared backend achieved for this stream.
+
+        Args:
+            log_queue (Queue): Queue for logging information.
+
+        Returns:
+            None
+        """
+        if not self.latencies:
+            return
+        latencies = np.array(self.latencies)
+        summary = (f'stream={self.stream_id}|chunks={len(latencies)}|mean={latencies.mean():.3f}'
+                   f'|p95={np.percentile(latencies, 95):.3f}|max={latencies.max():.3f}')
+        log_queue.put(f'{datetime.datetime.now().strftime("%H:%M:%S")}|LATENCY_SUMMARY|{summary}')
+        print(f'Latency: {summary}')
+
+class DecodingController:
+    """
+    Chooses model_server's decoding settings from the measured real-time factor and lag.
+
+    The real-time factor of a call is its wall time over the seconds of audio it transcribed, and the
+    lag is the time from the capture of a chunk to the end of its transcription. Both are smoothed over
+    the calls. When either exceeds its limit, decoding steps down one of DECODING_LEVELS: greedy
+    decoding first, then fewer candidates when falling back to higher temperatures, then no temperature
+    fallback. When both are well within their limits it steps back up, but never above top_level.
+
+    Args:
+        top_level (int, optional): Index of the most accurate level of DECODING_LEVELS to use. Defaults to 0.
+    """
+
+    def __init__(self, top_level=0):
+        self.top_level = top_level
+        self.level = top_level
+        self.rtf = None
+        self.lag = None
+        self.calls_since_change = 0
+        # Calls made at each level
+        self.level_calls = collections.Counter()
+
+    def options(self):
+        return dict(DECODING_LEVELS[self.level])
+
+    def update(self, call_seconds, descriptors, log_queue):
+        """
+        Record a transcription call and change the decoding level if the worker fell behind or has headroom again.
+
+        Args:
+            call_seconds (float): Wall time of the call.
+            descriptors (list): ChunkDescriptors transcribed by the call.
+            log_queue (Queue): Queue for logging information.
+
+        Returns:
+            None
+        """
+        self.level_calls[self.level] += 1
+        self.calls_since_change += 1
+        rtf = call_seconds / max(sum(descriptor.length for descriptor in descriptors) / MODEL_RATE, 1e-9)
+        lag = max(time.time() - descriptor.captured_at for descriptor in descriptors)
+        self.rtf = rtf if self.rtf is None else DECODING_SMOOTHING * rtf + (1 - DECODING_SMOOTHING) * self.rtf
+        self.lag = lag if self.lag is None else DECODING_SMOOTHING * lag + (1 - DECODING_SMOOTHING) * self.lag
+        if self.calls_since_change < DECODING_PATIENCE:
+            return
+
+        previous_level = self.level
+        if (self.lag > DECODING_LAG_SLO or self.rtf > DECODING_RTF_HIGH) and self.level < len(DECODING_LEVELS) - 1:
+            self.level += 1
+        elif self.lag < DECODING_LAG_SLO / 2 and self.rtf < DECODING_RTF_LOW and self.level > self.top_level:
+            self.level -= 1
+        if self.level == previous_level:
+            return
+
+        self.calls_since_change = 0
+        options = DECODING_LEVELS[self.level]
+        log_queue.put(f'{datetime.datetime.now().strftime("%H:%M:%S")}|{descriptors[-1].chunk_id}|DECODING_LEVEL|level={self.level}|previous={previous_level}'
+                      f'|rtf={self.rtf:.3f}|lag={self.lag:.3f}|beam_size={options["beam_size"]}|best_of={options["best_of"]}'
+                      f'|temperature_fallback={"on" if isinstance(options["temperature"], list) else "off"}')
+
+    def log_summary(self, log_queue):
+        if not self.level_calls:
+            return
+        calls = '|'.join(f'level_{level}={self.level_calls[level]}' for level in range(len(DECODING_LEVELS)))
+        log_queue.put(f'{datetime.datetime.now().strftime("%H:%M:%S")}|DECODING_SUMMARY|{calls}')
+
+class VadStats:
+    """
+    Counts the chunks whose speech regions came with them from the capture VAD, and the VAD runs model_server still made.
+
+    The time saved is estimated from the cost of the VAD per second of audio, measured on model_server's
+    own runs, or on AUDIO_CHUNK_LENGTH seconds of noise when it made none.
+    """
+
+    def __init__(self):
+        self.reused_chunks = 0
+        self.reused_seconds = 0.0
+        self.runs = 0
+        self.run_audio_seconds = 0.0
+        self.run_seconds = 0.0
+        noise = (np.random.default_rng(0).standard_normal(AUDIO_CHUNK_LENGTH * MODEL_RATE) * 0.01).astype(np.float32)
+        calibration_start = time.perf_counter()
+        get_speech_timestamps(noise, VadOptions())
+        self.calibrated_cost = (time.perf_counter() - calibration_start) / AUDIO_CHUNK_LENGTH
+
+    def record_reused(self, audio_seconds):
+        self.reused_chunks += 1
+        self.reused_seconds += audio_seconds
+
+    def record_run(self, audio_seconds, seconds):
+        self.runs += 1
+        self.run_audio_seconds += audio_seconds
+        self.run_seconds += seconds
+
+    def log_summary(self, log_queue, worker_id):
+        cost = self.run_seconds / self.run_audio_seconds if self.runs else self.calibrated_cost
+        summary = (f'reused_chunks={self.reused_chunks}|reused_audio_seconds={self.reused_seconds:.1f}|vad_runs={self.runs}'
+                   f'|vad_seconds={self.run_seconds:.2f}|saved_seconds={self.reused_seconds * cost:.2f}')
+        log_queue.put(f'{datetime.datetime.now().strftime("%H:%M:%S")}|VAD_SUMMARY|worker={worker_id}|{summary}')
+        print(f'Transcription process {worker_id} VAD: {summary}')
+
+class AlignmentStats:
+    """
+    Timings of model_server's transcription ticks, and of the word alignments run separately with DEFERRED_ALIGNMENT.
+
+    A tick is the decoding of one chunk, or of one batch shared evenly by its chunks, including the word
+    alignment unless it is deferred. The decode time deferred alignment saves per tick is the difference
+    in mean tick time between runs with and without it, less its own alignment time.
+
+    A deferred tick that commits words encodes its audio a second time to align them, so deferral only pays off
+    while most ticks commit nothing. With DEFERRED_ALIGNMENT the commit rate of the last DEFERRED_ALIGNMENT_WINDOW
+    ticks is tracked, whether they were deferred or not, and deferral pauses while it is above DEFERRED_ALIGNMENT_MAX_RATE.
+    """
+
+    def __init__(self):
+        self.ticks = 0
+        self.tick_seconds = 0.0
+        self.alignments = 0
+        self.alignment_seconds = 0.0
+        # Ticks decoded without word timestamps, and whether each recent tick committed words
+        self.deferred_ticks = 0
+        self.commits = collections.deque(maxlen=DEFERRED_ALIGNMENT_WINDOW)
+
+    def record_tick(self, seconds, chunks=1):
+        self.ticks += chunks
+        self.tick_seconds += seconds
+
+    def record_alignment(self, seconds):
+        self.alignments += 1
+        self.alignment_seconds += seconds
+
+    def record_commit(self, committed, deferred):
+        self.commits.append(committed)
+        self.deferred_ticks += deferred
+
+    def commit_rate(self):
+        return sum(self.commits) / max(len(self.commits), 1)
+
+    def defer(self):
+        """
+        Returns:
+            bool: Whether the next tick is decoded without word timestamps.
+        """
+        return DEFERRED_ALIGNMENT and (len(self.commits) < self.commits.maxlen or self.commit_rate() <= DEFERRED_ALIGNMENT_MAX_RATE)
+
+    def log_summary(self, log_queue, worker_id):
+        if not self.ticks:
+            return
+        # Deferred ticks either skipped the alignment or encoded their audio again for it
+        summary = (f'deferred={int(DEFERRED_ALIGNMENT)}|ticks={self.ticks}|mean_tick_seconds={self.tick_seconds / self.ticks:.3f}'
+                   f'|deferred_ticks={self.deferred_ticks}|skipped_alignments={self.deferred_ticks - self.alignments}'
+                   f'|reencoded_alignments={self.alignments}|commit_rate={self.commit_rate():.2f}|alignment_seconds={self.alignment_seconds:.2f}'
+                   f'|alignment_seconds_per_tick={self.alignment_seconds / self.ticks:.3f}')
+        log_queue.put(f'{datetime.datetime.now().strftime("%H:%M:%S")}|ALIGNMENT_SUMMARY|worker={worker_id}|{summary}')
+        print(f'Transcription process {worker_id} alignment: {summary}')
+
+class CpuMeter:
+    """
+    Splits the CPU time of the process between the transcription tiers running in it.
+
+    CTranslate2 decodes on its own threads, so the CPU time of the thread calling a tier misses most of its
+    work. The process CPU time is read whenever a tier starts or stops, and the CPU time of each interval
+    is shared evenly by the tiers that ran in it.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = set()
+        self.cpu_time = time.process_time()
+        # CPU seconds charged to each tier so far, by tier name
+        self.charged = collections.defaultdict(float)
+
+    def charge(self):
+        cpu_time = time.process_time()
+        for name in self.active:
+            self.charged[name] += (cpu_time - self.cpu_time) / len(self.active)
+        self.cpu_time = cpu_time
+
+    def start(self, name):
+        """
+        Returns:
+            float: CPU seconds charged to the tier before this call, to subtract from the result of stop.
+        """
+        with self.lock:
+            self.charge()
+            self.active.add(name)
+            return self.charged[name]
+
+    def stop(self, name):
+        """
+        Returns:
+            float: CPU seconds charged to the tier so far.
+        """
+        with self.lock:
+            self.charge()
+            self.active.discard(name)
+            return self.charged[name]
+
+class TierStats:
+    """
+    Latency and CPU cost of one transcription tier.
+
+    Args:
+        name (str): Name of the tier in the log.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.latencies = []
+        self.cpu_seconds = 0.0
+        self.audio_seconds = 0.0
+
+    def record(self, latency, cpu_seconds, audio_seconds):
+        self.latencies.append(latency)
+        self.cpu_seconds += cpu_seconds
+        self.audio_seconds += audio_seconds
+
+    def log_summary(self, log_queue):
+        if not self.latencies:
+            return
+        latencies = np.array(self.latencies)
+        summary = (f'tier={self.name}|calls={len(latencies)}|mean_latency={latencies.mean():.3f}|p95_latency={np.percentile(latencies, 95):.3f}'
+                   f'|cpu_seconds={self.cpu_seconds:.2f}|cpu_per_audio_second={self.cpu_seconds / max(self.audio_seconds, 1e-9):.3f}')
+        log_queue.put(f'{datetime.datetime.now().strftime("%H:%M:%S")}|TIER_SUMMARY|{summary}')
+        print(f'Tier: {summary}')
+
+class CascadeConfirmer:
+    """
+    Confirm tier of cascade mode: transcribes committed draft words again with a larger model on a background thread.
+
+    A LocalAgreement commit is often only a few words, too little context for the confirming model, so
+    consecutive commits of a stream are confirmed as one span once it reaches CONFIRM_MIN_SECONDS, ends a
+    sentence or closes an utterance. The span is copied from the audio buffer with CONFIRM_PAD_MS on each
+    side when it is queued, the pruned audio stays readable until the ring buffer wraps around. Spans are
+    confirmed in the order they were committed, and the confirmed text is sent to the display process
+    together with the stream's current drafts.
+
+    Args:
+        audio_buffers (dict): model_server's mapped shared audio buffers by shared memory name.
+        output_queue (Queue): Queue for sending transcribed text segments to the display process.
+        log_queue (Queue): Queue for logging information.
+        cpu_meter (CpuMeter): Meter splitting the process CPU time between this tier and the draft tier.
+        size (str, optional): Size of the confirming model. Defaults to CONFIRM_MODEL.
+    """
+
+    def __init__(self, audio_buffers, output_queue, log_queue, cpu_meter, size=CONFIRM_MODEL):
+        self.audio_buffers = audio_buffers
+        self.output_queue = output_queue
+        self.log_queue = log_queue
+        self.model = initialize_model(log_queue, size, cpu_threads=WORKER_CPU_THREADS)
+        self.stats = TierStats('confirm')
+        self.cpu_meter = cpu_meter
+        self.jobs = queue.Queue()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, descriptor, transcript, start_time, end_time, draft):
+        """
+        Add a committed span to the stream's span waiting for confirmation, and queue that for confirmation once it is long enough.
+
+        Args:
+            descriptor (ChunkDescriptor): The chunk the span was committed from.
+            transcript (StreamTranscript): Transcript state of the chunk's stream.
+            start_time (float): Start of the span in absolute seconds.
+            end_time (float): End of the span in absolute seconds.
+            draft (str): Text of the committed draft words.
+
+        Returns:
+            None
+        """
+        transcript.pending_drafts.append(draft)
+        if transcript.cascade_span is None:
+            transcript.cascade_span = (descriptor, start_time, end_time, 1)
+        else:
+            transcript.cascade_span = (descriptor, transcript.cascade_span[1], end_time, transcript.cascade_span[3] + 1)
+        if descriptor.final or draft.rstrip().endswith(('.', '?', '!')) or end_time - transcript.cascade_span[1] >= CONFIRM_MIN_SECONDS:
+            self.flush(transcript)
+
+    def flush(self, transcript):
+        """
+        Queue the span of a stream waiting for confirmation, if there is one.
+
+        Args:
+            transcript (StreamTranscript): Transcript state of the stream.
+
+        Returns:
+            None
+        """
+        if transcript.cascade_span is None:
+            return
+        descriptor, start_time, end_time, draft_count = transcript.cascade_span
+        transcript.cascade_span = None
+        audio_buffer = self.audio_buffers[descriptor.buffer_name]
+        pad = CONFIRM_PAD_MS * MODEL_RATE // 1000
+        start = max(int(start_time * MODEL_RATE) - pad, audio_buffer.write_cursor - audio_buffer.capacity, 0)
+        end = min(int(end_time * MODEL_RATE) + pad, descriptor.offset + descriptor.length)
+        audio = audio_buffer.view(start, end).copy()
+        draft = ''.join(list(transcript.pending_drafts)[-draft_count:])
+        self.jobs.put((descriptor, transcript, audio, draft, draft_count, time.perf_counter()))
+
+    def run(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+            descriptor, transcript, audio, draft, draft_count, submitted_at = job
+            cpu_start = self.cpu_meter.start(self.stats.name)
+            prompt = transcript.cascade_transcript[-PROMPT_CHARACTERS:].strip() or None
+            segments, info = self.model.transcribe(audio, beam_size=CONFIRM_BEAM_SIZE, vad_filter=False, initial_prompt=prompt,
+                                                   condition_on_previous_text=False)
+            confirmed_transcript = ''.join(segment.text for segment in segments)
+            self.stats.record(time.perf_counter() - submitted_at, self.cpu_meter.stop(self.stats.name) - cpu_start, len(audio) / MODEL_RATE)
+
+            transcript.cascade_transcript += confirmed_transcript
+            for _ in range(draft_count):
+                transcript.pending_drafts.popleft()
+            self.log_queue.put(f'{datetime.datetime.now().strftime("%H:%M:%S")}|{descriptor.chunk_id}|CASCADE_CONFIRMED|stream={descriptor.stream_id}'
+                               f'|draft={draft}|confirmed={confirmed_transcript}')
+            unconfirmed_transcript = ''.join(transcript.pending_drafts) + transcript.unconfirmed_transcript
+            self.output_queue.put(TranscriptUpdate(datetime.datetime.now().strftime("%H:%M:%S"), confirmed_transcript, unconfirmed_transcript,
+                                                   descriptor.stream_id, descriptor.chunk_id))
+
+    def close(self):
+        """
+        Confirm the spans still queued, then stop the thread and report the tier's cost.
+
+        Returns:
+            None
+        """
+        self.jobs.put(None)
+        self.thread.join()
+        self.stats.log_summary(self.log_queue)
+
+#- End Transcription classes -#
+
+###############################################################################################
+
+#- Audio buffer classes -#
+
+class AudioRingBuffer:
+    """
+    Fixed-capacity ring buffer of audio samples with sample-accurate read and write cursors.
+
+    Cursors are absolute sample indices counted from the start of the recording, so a position
+    handed out with one chunk stays valid after later writes and prunes. Every sample is stored
+    twice, at its ring position and one capacity further on, which lets any range of up to
+    `capacity` samples be returned as a contiguous zero-copy view.
+
+    When shared is True the cursors, the capacity and the samples live in a named shared memory
+    block, so another process can map the same buffer with AudioRingBuffer.attach and read audio
+    ranges without any copy through a pipe.
+
+    Args:
+        capacity (int): Maximum number of samples held by the buffer.
+        dtype (numpy dtype, optional): Sample type. Defaults to np.int16.
+        shared (bool, optional): Whether to allocate the buffer in shared memory. Defaults to False.
+        shm (SharedMemory, optional): Existing shared memory block to map instead of allocating one. Used by attach.
+    """
+
+    # Header of int64 values in front of the samples: write cursor, read cursor, capacity
+    HEADER_LENGTH = 3
+
+    def __init__(self, capacity, dtype=np.int16, shared=False, shm=None):
+        self.dtype = np.dtype(dtype)
+        header_size = self.HEADER_LENGTH * np.dtype(np.int64).itemsize
+        if shared and shm is None:
+            shm = shared_memory.SharedMemory(create=True, size=header_size + 2 * capacity * self.dtype.itemsize)
+        self.shm = shm
+
+        if shm is None:
+            self.header = np.zeros(self.HEADER_LENGTH, dtype=np.int64)
+            self.samples = np.zeros(2 * capacity, dtype=self.dtype)
+        else:
+            self.header = np.ndarray((self.HEADER_LENGTH,), dtype=np.int64, buffer=shm.buf)
+            if capacity is None:
+                capacity = int(self.header[2])
+            self.samples = np.ndarray((2 * capacity,), dtype=self.dtype, buffer=shm.buf, offset=header_size)
+        self.header[2] = capacity
+        self.capacity = capacity
+
+    @classmethod
+    def attach(cls, name, dtype=np.int16):
+        """
+        Map a shared ring buffer created by another process.
+
+        Args:
+            name (str): Name of the shared memory block, as given by the name attribute of the creator.
+            dtype (numpy dtype, optional): Sample type used by the creator. Defaults to np.int16.
+
+        Returns:
+            AudioRingBuffer: Ring buffer backed by the same memory as the creator's.
+        """
+        try:
+            shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # Before Python 3.13 attaching always registers the block with the resource tracker, which is
+            # harmless for processes started by multiprocessing because they share the creator's tracker
+            shm = shared_memory.SharedMemory(name=name)
+        return cls(None, dtype, shm=shm)
+
+    @property
+    def name(self):
+        return self.shm.name if self.shm is not None else None
+
+    # write_cursor is the index of the next sample to be written, read_cursor the oldest sample kept. The writer only
+    # moves write_cursor and the processing thread only moves read_cursor, so neither write can undo the other. The
+    # stored read cursor can fall behind the samples overwritten since, readers clamp it
+    @property
+    def write_cursor(self):
+        return int(self.header[0])
+
+    @write_cursor.setter
+    def write_cursor(self, position):
+        self.header[0] = position
+
+    @property
+    def read_cursor(self):
+        return max(int(self.header[1]), self.write_cursor - self.capacity)
+
+    @read_cursor.setter
+    def read_cursor(self, position):
+        self.header[1] = position
+
+    def __len__(self):
+        return self.write_cursor - self.read_cursor
+
+    def write(self, data):
+        """
+        Append samples to the buffer, overwriting the oldest samples once it is full.
+
+        Args:
+            data (ndarray): One dimensional array of samples.
+
+        Returns:
+            None
+        """
+        if len(data) > self.capacity:
+            self.write_cursor += len(data) - self.capacity
+            data = data[-self.capacity:]
+
+        length = len(data)
+        start = self.write_cursor % self.capacity
+        # The first copy is contiguous from start, the mirror copy wraps around the end of the array
+        self.samples[start:start + length] = data
+        mirror_length = min(length, self.capacity - start)
+        self.samples[start + self.capacity:start + self.capacity + mirror_length] = data[:mirror_length]
+        self.samples[:length - mirror_length] = data[mirror_length:]
+
+        # The samples are in place before the cursor that publishes them to readers moves
+        self.write_cursor += length
+
+    def view(self, start=None, end=None):
+        """
+        Return a zero-copy view of the samples between two absolute positions.
+
+        Samples before the read cursor can still be viewed until they are overwritten.
+
+        Args:
+            start (int, optional): Absolute index of the first sample. Defaults to the read cursor.
+            end (int, optional): Absolute index one past the last sample. Defaults to the write cursor.
+
+        Returns:
+            ndarray: View into the buffer. It is only valid until the range is overwritten.
+        """
+        start = self.read_cursor if start is None else max(start, self.write_cursor - self.capacity)
+        end = self.write_cursor if end is None else min(end, self.write_cursor)
+        end = max(start, end)
+        offset = start % self.capacity
+        return self.samples[offset:offset + end - start]
+
+    def prune(self, position):
+        """
+        Drop every sample before an absolute position by moving the read cursor. Only the processing thread prunes.
+
+        Args:
+            position (int): Absolute index of the first sample to keep.
+
+        Returns:
+            None
+        """
+        self.read_cursor = min(max(self.read_cursor, position), self.write_cursor)
+
+    def is_available(self, start):
+        """
+        Check whether the samples from an absolute position onwards have not been overwritten yet.
+
+        Args:
+            start (int): Absolute index of the first sample of a range.
+
+        Returns:
+            bool: True if the range can still be read.
+        """
+        return start >= self.write_cursor - self.capacity
+
+    def close(self, unlink=False):
+        """
+        Release the shared memory mapping of the buffer, if any.
+
+        Args:
+            unlink (bool, optional): Also destroy the shared memory block. Only the creator should do this. Defaults to False.
+
+        Returns:
+            None
+        """
+        if self.shm is None:
+            return
+        del self.header, self.samples
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+class ChunkDescriptor(NamedTuple):
+    """
+    Reference to a range of a shared audio ring buffer, sent to model_server in place of the audio.
+
+    Attributes:
+        buffer_name (str): Name of the shared memory block holding the audio.
+        offset (int): Absolute sample index of the first sample of the chunk.
+        length (int): Number of samples in the chunk.
+        sequence (int): Number of the chunk within its stream, starting at 0.
+        chunk_id (str): ID of the audio chunk.
+        stream_id (int): ID of the capture stream the audio belongs to.
+        captured_at (float): Wall clock time at which the last sample of the chunk had been processed.
+        speech_regions (tuple): (start, end) sample ranges of speech relative to the chunk, padded and merged,
+            found by the capture VAD. None when the chunk comes without them and model_server has to run the VAD.
+        final (bool): Whether the chunk ends an utterance, all of its words are then confirmed and the buffer emptied.
+    """
+    buffer_name: str
+    offset: int
+    length: int
+    sequence: int
+    chunk_id: str
+    stream_id: int = 0
+    captured_at: float = 0.0
+    speech_regions: tuple = None
+    final: bool = False
+
+class StreamingResampler:
+    """
+    Stateful polyphase resampler that converts audio to another sample rate one block at a time.
+
+    The last taps-1 input samples and the position of the next output sample are carried between
+    calls, so feeding a recording in blocks of any size gives the same output as resampling it in
+    one pass, and each input sample is only filtered once.
+
+    Args:
+        orig_rate (int): Sample rate of the input audio.
+        target_rate (int, optional): Sample rate of the output audio. Defaults to MODEL_RATE.
+    """
+
+    def __init__(self, orig_rate, target_rate=MODEL_RATE):
+        divisor = math.gcd(orig_rate, target_rate)
+        self.up, self.down = target_rate // divisor, orig_rate // divisor
+        self.branches = design_resampling_filter(self.up, self.down)
+        self.history = np.zeros(self.branches.shape[1] - 1, dtype=np.float32)
+        # input_count is the number of input samples consumed, output_count the index of the next output sample
+        self.input_count = 0
+        self.output_count = 0
+
+    def process(self, audio):
+        """
+        Resample the next block of audio.
+
+        Args:
+            audio (ndarray): One dimensional array of float32 samples at orig_rate.
+
+        Returns:
+            ndarray: Array of float32 samples at target_rate. Its length varies by one sample between
+                calls when the rates are not integer multiples of each other.
+        """
+        if self.up == self.down:
+            return audio.astype(np.float32, copy=False)
+
+        # windows[i] holds the input samples input_count+i-taps+1 through input_count+i
+        padded = np.concatenate((self.history, audio))
+        windows = np.lib.stride_tricks.sliding_window_view(padded, self.branches.shape[1])
+
+        total_count = self.input_count + len(audio)
+        num_outputs = max(0, (total_count * self.up - 1) // self.down + 1 - self.output_count)
+        resampled = np.empty(num_outputs, dtype=np.float32)
+        for block_start in range(0, num_outputs, RESAMPLER_BLOCK):
+            block_end = min(block_start + RESAMPLER_BLOCK, num_outputs)
+            positions = np.arange(self.output_count + block_start, self.output_count + block_end) * self.down
+            resampled[block_start:block_end] = np.einsum('ij,ij->i', self.branches[positions % self.up],
+                                                         windows[positions // self.up - self.input_count])
+
+        self.history = padded[len(padded) - len(self.history):].copy()
+        self.input_count = total_count
+        self.output_count += num_outputs
+        return resampled
+
+class StreamingVad:
+    """
+    Streaming wrapper around the Silero VAD model that only scores newly captured audio.
+
+    The recurrent state of the model, the unscored tail of the last block and the onset/offset
+    hysteresis are kept between calls, so each sample is scored exactly once. The thresholds
+    follow get_speech_timestamps: speech starts at a probability of at least threshold and ends
+    once the probability has stayed below threshold - 0.15 for min_silence_duration_ms. As get_speech_timestamps
+    drops segments shorter than min_speech_duration_ms, the start is only emitted once the speech has lasted
+    that long, with the sample of the onset.
+
+    Args:
+        vad_options (VadOptions): Threshold, minimum speech and silence durations and window size to use.
+        session (InferenceSession, optional): ONNX session to run. Defaults to the shared session from get_vad_session.
+    """
+
+    def __init__(self, vad_options, session=None):
+        self.session = session or get_vad_session()
+        self.window = vad_options.window_size_samples
+        self.threshold = vad_options.threshold
+        self.neg_threshold = vad_options.threshold - 0.15
+        self.min_speech_samples = MODEL_RATE * vad_options.min_speech_duration_ms / 1000
+        self.min_silence_samples = MODEL_RATE * vad_options.min_silence_duration_ms / 1000
+        self.h = np.zeros((2, 1, 64), dtype=np.float32)
+        self.c = np.zeros((2, 1, 64), dtype=np.float32)
+        self.sample_rate = np.array(MODEL_RATE, dtype=np.int64)
+        self.pending = np.zeros(0, dtype=np.float32)
+        # sample_count is the absolute index of the first sample in pending
+        self.sample_count = 0
+        self.triggered = False
+        # Sample of a speech onset that has not lasted min_speech_duration_ms yet, or None
+        self.onset = None
+        self.temp_end = 0
+
+    def process(self, audio):
+        """
+        Score the new audio and update the speech state.
+
+        Args:
+            audio (ndarray): Float32 samples at MODEL_RATE that follow the previously processed audio.
+
+        Returns:
+            list: (event, sample) tuples where event is 'speech_start' or 'speech_end' and sample is
+                the absolute sample index at which it happened.
+        """
+        events = []
+        data = np.concatenate((self.pending, audio))
+        num_windows = len(data) // self.window
+
+        for i in range(num_windows):
+            position = self.sample_count + i * self.window
+            ort_inputs = {"input": data[None, i * self.window:(i + 1) * self.window], "h": self.h, "c": self.c, "sr": self.sample_rate}
+            output, self.h, self.c = self.session.run(None, ort_inputs)
+            speech_prob = output.item()
+
+            if speech_prob >= self.threshold:
+                self.temp_end = 0
+                if not self.triggered:
+                    if self.onset is None:
+                        self.onset = position
+                    if position + self.window - self.onset >= self.min_speech_samples:
+                        self.triggered = True
+                        events.append(('speech_start', self.onset))
+                        self.onset = None
+            elif speech_prob < self.neg_threshold and (self.triggered or self.onset is not None):
+                if not self.temp_end:
+                    self.temp_end = position
+                if position - self.temp_end >= self.min_silence_samples:
+                    # Speech that never lasted min_speech_duration_ms is dropped without events
+                    if self.triggered:
+                        events.append(('speech_end', self.temp_end))
+                    self.triggered = False
+                    self.onset = None
+                    self.temp_end = 0
+
+        self.pending = data[num_windows * self.window:]
+        self.sample_count += num_windows * self.window
+        return events
+
+    def skip(self, num_samples):
+        """
+        Account for audio that was lost or gated before it could be scored.
+
+        Args:
+            num_samples (int): Number of samples not scored after the previously processed audio.
+
+        Returns:
+            None
+        """
+        self.sample_count += len(self.pending) + num_samples
+        self.pending = np.zeros(0, dtype=np.float32)
+        # Audio is only skipped outside speech, an onset that has not lasted long enough yet ends with it
+        if not self.triggered:
+            self.onset = None
+            self.temp_end = 0
+
+class EnergyGate:
+    """
+    Cheap pre-gate that marks blocks of audio as obviously silent before they reach the VAD.
+
+    Audio is split into windows of VAD_WINDOW samples and the RMS and zero-crossing rate of all
+    windows are computed at once. The noise floor follows the quietest windows: it drops to any
+    window below it and otherwise rises by at most ENERGY_GATE_FLOOR_RISE per window, which is
+    evaluated for every window in one pass with a running minimum in the log domain. A window is
+    active when its RMS exceeds the floor by ENERGY_GATE_RATIO, or when it is above the floor with
+    the high zero-crossing rate of a fricative. The gate stays open for ENERGY_GATE_HANGOVER windows
+    after the last active one.
+
+    Args:
+        window (int, optional): Samples per window. Defaults to VAD_WINDOW.
+    """
+
+    def __init__(self, window=VAD_WINDOW):
+        self.window = window
+        self.noise_floor = None
+        self.hangover = 0
+        self.pending = np.zeros(0, dtype=np.float32)
+        # Samples passed on to the VAD and samples the gate skipped
+        self.open_samples = 0
+        self.gated_samples = 0
+
+    def process(self, audio):
+        """
+        Update the noise floor with the new audio and decide whether it may contain speech.
+
+        Args:
+            audio (ndarray): Float32 samples at MODEL_RATE that follow the previously processed audio.
+
+        Returns:
+            bool: False if the audio is silent and can skip the VAD.
+        """
+        data = np.concatenate((self.pending, audio))
+        num_windows = len(data) // self.window
+        self.pending = data[num_windows * self.window:]
+        if num_windows:
+            windows = data[:num_windows * self.window].reshape(num_windows, self.window)
+            rms = np.maximum(np.sqrt(np.mean(windows ** 2, axis=1)), ENERGY_GATE_MIN_FLOOR)
+            zcr = np.count_nonzero(np.diff(np.signbit(windows), axis=1), axis=1) / self.window
+            if self.noise_floor is None:
+                self.noise_floor = rms[0]
+
+            # floor[i] = min(floor[i-1] * rise, rms[i]), unrolled as a running minimum of log(rms[i]) - i * log(rise)
+            rise = np.log(ENERGY_GATE_FLOOR_RISE) * np.arange(num_windows + 1)
+            log_floor = np.minimum.accumulate(np.concatenate(([np.log(self.noise_floor)], np.log(rms) - rise[1:]))) + rise
+            # Each window is compared with the floor before it
+            floor = np.exp(log_floor[:-1])
+            self.noise_floor = max(np.exp(log_floor[-1]), ENERGY_GATE_MIN_FLOOR)
+
+            active = (rms > floor * ENERGY_GATE_RATIO) | ((zcr > ENERGY_GATE_ZCR) & (rms > floor * np.sqrt(ENERGY_GATE_RATIO)))
+            if active.any():
+                self.hangover = ENERGY_GATE_HANGOVER - (num_windows - 1 - np.flatnonzero(active)[-1])
+                is_open = True
+            else:
+                is_open = self.hangover > 0
+                self.hangover -= num_windows
+        else:
+            is_open = self.hangover > 0
+
+        if is_open:
+            self.open_samples += len(audio)
+        else:
+            self.gated_samples += len(audio)
+        return is_open
+
+    def log_stats(self, log_queue, stream_id, skipped_chunks):
+        """
+        Report how much audio the gate kept away from the VAD and how many chunks skipped transcription.
+
+        Args:
+            log_queue (Queue): Queue for logging information.
+            stream_id (int): ID of the stream being gated.
+            skipped_chunks (int): Number of chunks that were not sent to model_server because they only added silence.
+
+        Returns:
+            None
+        """
+        total_samples = max(self.open_samples + self.gated_samples, 1)
+        log_queue.put(f'{datetime.datetime.now().strftime("%H:%M:%S")}|GATE_STATS|stream={stream_id}|gated_seconds={self.gated_samples / MODEL_RATE:.2f}'
+                      f'|gated_fraction={self.gated_samples / total_samples:.3f}|skipped_chunks={skipped_chunks}'
+                      f'|noise_floor={self.noise_floor or 0:.5f}')
+
+class AudioCapture:
+    """
+    Receives audio from the PortAudio callback thread and writes it into the capture ring buffer.
+
+    The callback only resamples the new block and writes it into the ring buffer, then signals
+    data_ready. Processing reads the ring buffer behind the write cursor on another thread, so a slow
+    VAD pass or chunk dispatch can never block capture. Overflow and underrun flags reported by
+    PortAudio are counted, and gaps in the ADC timestamps of consecutive blocks are counted as
+    dropped samples.
+
+    Args:
+        audio_buffer (AudioRingBuffer): Float32 buffer that receives the audio at MODEL_RATE.
+        rate (int): The capture rate of the audio stream in Hz.
+        data_ready (Event, optional): Event to set when audio is written. Defaults to a new event.
+    """
+
+    def __init__(self, audio_buffer, rate, data_ready=None):
+        self.audio_buffer = audio_buffer
+        self.rate = rate
+        self.resampler = StreamingResampler(rate)
+        self.data_ready = data_ready or threading.Event()
+        self.overflows = 0
+        self.underruns = 0
+        # Samples at MODEL_RATE lost by the device, and lost because processing fell a full buffer behind
+        self.dropped_samples = 0
+        self.overrun_samples = 0
+        self.next_adc_time = None
+        # Absolute index of the first sample not yet seen by processing, maintained by process_stream
+        self.processed_cursor = 0
+        # Sequences of the last chunk sent to the worker pool and of the last one it transcribed, maintained by process_stream
+        self.sent_sequence = -1
+        self.transcribed_sequence = -1
+
+    def callback(self, in_data, frame_count, time_info, status_flags):
+        """
+        PyAudio stream callback, called on the PortAudio thread for every captured block.
+
+        Args:
+            in_data (bytes): Captured int16 audio.
+            frame_count (int): Number of frames in in_data.
+            time_info (dict): PortAudio timing information for the block.
+            status_flags (int): PortAudio status flags for the block.
+
+        Returns:
+            tuple: No output data and the flag to keep the stream running.
+        """
+        if status_flags & pyaudio.paInputOverflow:
+            self.overflows += 1
+        if status_flags & pyaudio.paInputUnderflow:
+            self.underruns += 1
+
+        # Some host APIs report an ADC time of 0, in which case gaps can only be seen through the flags
+        adc_time = time_info.get('input_buffer_adc_time', 0)
+        if adc_time and self.next_adc_time is not None:
+            gap = adc_time - self.next_adc_time
+            if gap * self.rate > frame_count / 2:
+                self.dropped_samples += round(gap * MODEL_RATE)
+        self.next_adc_time = adc_time + frame_count / self.rate if adc_time else None
+
+        self.audio_buffer.write(self.resampler.process(pcm_to_float32(np.frombuffer(in_data, dtype=np.int16))))
+        self.data_ready.set()
+        return (None, pyaudio.paContinue)
+
+    def wait_for_space(self):
+        """
+        Block until processing has caught up to within half of the audio buffer, and the last chunk sent has been transcribed.
+
+        Used by replay sources running faster than real time, so that no audio is overwritten before it is processed and
+        the replay runs at the pace of transcription, not of the capture VAD, with no chunks coalesced away.
+
+        Returns:
+            None
+        """
+        while (self.audio_buffer.write_cursor - self.processed_cursor > self.audio_buffer.capacity // 2
+               or self.transcribed_sequence < self.sent_sequence):
+            time.sleep(0.005)
+
+    def log_stats(self, log_queue, stream_id):
+        """
+        Report the overflow, underrun and dropped sample counts.
+
+        Args:
+            log_queue (Queue): Queue for logging information.
+            stream_id (int): ID of the stream being captured.
+
+        Returns:
+            None
+        """
+        log_queue.put(f'{datetime.datetime.now().strftime("%H:%M:%S")}|CAPTURE_STATS|stream={stream_id}|overflows={self.overflows}|underruns={self.underruns}'
+                      f'|dropped_samples={self.dropped_samples}|overrun_samples={self.overrun_samples}')
+
+class AudioArchiver:
+    """
+    Appends the audio of a capture stream to a session archive on a background thread.
+
+    Every sample is written once, as it is captured, so disk use grows linearly with the recorded
+    time. Chunks are only recorded in an index file as an (offset, length) reference into the archive.
+    The thread reads the shared ring buffer directly and also writes the index, so the capture and
+    processing threads never touch the disk.
+
+    Args:
+        audio_buffer (AudioRingBuffer): Float32 buffer the stream is captured into, at MODEL_RATE.
+        path (str): Path of the archive file, without extension.
+        log_queue (Queue): Queue for logging information.
+        archive_format (str, optional): 'WAV', 'FLAC' or 'OPUS'. Defaults to ARCHIVE_FORMAT.
+    """
+
+    def __init__(self, audio_buffer, path, log_queue, archive_format=ARCHIVE_FORMAT):
+        self.audio_buffer = audio_buffer
+        self.path = path + ARCHIVE_EXTENSIONS[archive_format]
+        self.index_path = path + '_index.csv'
+        self.log_queue = log_queue
+        self.archive_format = archive_format
+        # Absolute index of the first archived sample, and of the next sample to archive
+        self.start_cursor = 0
+        self.archived_cursor = 0
+        self.pending_chunks = queue.Queue()
+        self.lost_samples = 0
+        self.thread = None
+        self.stopped = threading.Event()
+
+    def open(self):
+        if self.archive_format == 'WAV':
+            archive = wave.open(self.path, 'wb')
+            archive.setnchannels(CHANNELS)
+            archive.setsampwidth(2)
+            archive.setframerate(MODEL_RATE)
+            return archive
+        import soundfile
+        subtype = 'OPUS' if self.archive_format == 'OPUS' else 'PCM_16'
+        container = 'OGG' if self.archive_format == 'OPUS' else 'FLAC'
+        return soundfile.SoundFile(self.path, 'w', samplerate=MODEL_RATE, channels=CHANNELS, format=container, subtype=subtype)
+
+    def start(self, cursor):
+        """
+        Start archiving from an absolute position of the audio buffer.
+
+        Args:
+            cursor (int): Absolute index of the first sample to archive, stored at offset 0 of the archive.
+
+        Returns:
+            None
+        """
+        self.start_cursor = self.archived_cursor = cursor
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def add_chunk(self, chunk_id, offset, length):
+        """
+        Queue an index entry for a chunk. Only called from the processing thread, it does no I/O.
+
+        Args:
+            chunk_id (str): ID of the audio chunk.
+            offset (int): Absolute sample index of the first sample of the chunk.
+            length (int): Number of samples in the chunk.
+
+        Returns:
+            None
+        """
+        self.pending_chunks.put((chunk_id, offset - self.start_cursor, length))
+
+    def run(self):
+        with self.open() as archive, open(self.index_path, 'w') as index_file:
+            index_file.write('chunk_id,offset,length\n')
+            while not self.stopped.wait(ARCHIVE_INTERVAL):
+                self.archive(archive, index_file)
+            self.archive(archive, index_file)
+        self.log_queue.put(f'{datetime.datetime.now().strftime("%H:%M:%S")}|ARCHIVE_CLOSED|{self.path}'
+                           f'|samples={self.archived_cursor - self.start_cursor}|lost_samples={self.lost_samples}')
+
+    def archive(self, archive, index_file):
+        """
+        Append the audio captured since the last call to the archive and write the queued index entries.
+
+        Args:
+            archive (Wave_write or SoundFile): The open archive.
+            index_file (file): The open index file.
+
+        Returns:
+            None
+        """
+        write_cursor = self.audio_buffer.write_cursor
+        if write_cursor > self.archived_cursor:
+            audio = self.audio_buffer.view(self.archived_cursor, write_cursor).copy()
+            # Audio overwritten before it could be archived is replaced by silence, so archive offsets stay sample-accurate
+            if not self.audio_buffer.is_available(self.archived_cursor):
+                lost_samples = write_cursor - self.archived_cursor - len(audio)
+                audio = np.concatenate([np.zeros(lost_samples, dtype=np.float32), audio])
+                self.lost_samples += lost_samples
+                self.log_queue.put(f'{datetime.datetime.now().strftime("%H:%M:%S")}|ARCHIVE_OVERRUN|{self.path}|{lost_samples}')
+            if self.archive_format == 'WAV':
+                archive.writeframes(float32_to_pcm(audio))
+            else:
+                archive.write(audio)
+            self.archived_cursor = write_cursor
+
+        while not self.pending_chunks.empty():
+            chunk_id, offset, length = self.pending_chunks.get()
+            index_file.write(f'{chunk_id},{offset},{length}\n')
+            self.log_queue.put(f'{datetime.datetime.now().strftime("%H:%M:%S")}|{chunk_id}|ARCHIVED_AUDIO_CHUNK|{self.path}|{offset}|{length}')
+        index_file.flush()
+
+    def close(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+
+#- End Audio buffer classes -#
+
+###############################################################################################
+
+#- Audio source classes -#
+
+class AudioSource:
+    """
+    Interface for the audio inputs of process_stream.
+
+    A source delivers mono int16 audio at its own rate by calling AudioCapture.callback with the same
+    arguments PyAudio passes to a stream callback, from a thread of its own.
+
+    Attributes:
+        rate (int): Sample rate of the delivered audio in Hz.
+    """
+
+    rate = None
+
+    def start(self, capture):
+        """
+        Start delivering audio.
+
+        Args:
+            capture (AudioCapture): The capture whose callback receives the audio.
+
+        Returns:
+            None
+        """
+        raise NotImplementedError
+
+    def is_active(self):
+        """
+        Returns:
+            bool: False once the source has no more audio to deliver.
+        """
+        raise NotImplementedError
+
+    def stop(self):
+        """
+        Stop delivering audio.
+
+        Returns:
+            None
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """
+        Stop the source and release its resources.
+
+        Returns:
+            None
+        """
+        self.stop()
+
+class LiveAudioSource(AudioSource):
+    """
+    Records from a PyAudio input device through a stream callback.
+
+    The stream is opened when the source is created and only started by start.
+
+    Args:
+        device_index (int): PyAudio index of the input device.
+        rate (int, optional): Capture rate in Hz. Defaults to RATE, or the default rate of the device if RATE is None.
+    """
+
+    def __init__(self, device_index, rate=RATE):
+        self.pa = pyaudio.PyAudio()
+        self.rate = rate or int(self.pa.get_device_info_by_index(device_index)['defaultSampleRate'])
+        self.capture = None
+        self.stream = self.pa.open(format=FORMAT,
+                                   channels=CHANNELS,
+                                   rate=self.rate,
+                                   input=True,
+                                   input_device_index=device_index,
+                                   frames_per_buffer=CHUNK,
+                                   stream_callback=self.callback,
+                                   start=False)
+
+    def callback(self, in_data, frame_count, time_info, status_flags):
+        return self.capture.callback(in_data, frame_count, time_info, status_flags)
+
+    def start(self, capture):
+        self.capture = capture
+        self.stream.start_stream()
+
+    def is_active(self):
+        return self.stream.is_active()
+
+    def stop(self):
+        if self.stream.is_active():
+            self.stream.stop_stream()
+
+    def close(self):
+        self.stop()
+        self.stream.close()
+        self.pa.terminate()
+
+class ReplaySource(AudioSource):
+    """
+    Base class for sources that replay recorded audio from a thread, in blocks of CHUNK frames.
+
+    Subclasses set rate and implement blocks.
+
+    Args:
+        speed (float, optional): Replay pace as a multiple of real time, or None to replay as fast as
+            processing keeps up. Defaults to REPLAY_SPEED.
+    """
+
+    def __init__(self, speed=REPLAY_SPEED):
+        self.speed = speed
+        self.thread = None
+        self.stopped = threading.Event()
+
+    def blocks(self):
+        """
+        Yields:
+            ndarray: Consecutive blocks of mono int16 samples.
+        """
+        raise NotImplementedError
+
+    def start(self, capture):
+        self.thread = threading.Thread(target=self.replay, args=(capture,), daemon=True)
+        self.thread.start()
+
+    def replay(self, capture):
+        """
+        Deliver every block to the capture, paced according to speed.
+
+        Args:
+            capture (AudioCapture): The capture whose callback receives the audio.
+
+        Returns:
+            None
+        """
+        start_time = time.perf_counter()
+        position = 0
+        for block in self.blocks():
+            if self.stopped.is_set():
+                break
+            if self.speed:
+                delay = start_time + position / self.rate / self.speed - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            else:
+                capture.wait_for_space()
+            capture.callback(block.tobytes(), len(block), {'input_buffer_adc_time': position / self.rate}, 0)
+            position += len(block)
+
+    def is_active(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+
+def read_wav(path):
+    """
+    Read a 16-bit WAV file as mono int16 samples, averaging the channels of multichannel files.
+
+    Args:
+        path (str): Path to the WAV file.
+
+    Returns:
+        tuple: Array of int16 samples and the sample rate of the file in Hz.
+    """
+    with wave.open(path, 'rb') as wf:
+        if wf.getsampwidth() != 2:
+            raise ValueError(f'{path} has {8 * wf.getsampwidth()}-bit samples, only 16-bit WAV files can be replayed')
+        samples = np.frombuffer(wf.readframes(wf.getnframes()), dtype=np.int16)
+        channels = wf.getnchannels()
+        rate = wf.getframerate()
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1).astype(np.int16)
+    return samples, rate
+
+def read_audio_file(path):
+    """
+    Read a 16-bit WAV file, or a FLAC or Opus session archive, as mono int16 samples.
+
+    Args:
+        path (str): Path to the audio file.
+
+    Returns:
+        tuple: Array of int16 samples and the sample rate of the file in Hz.
+    """
+    if path.endswith('.wav'):
+        return read_wav(path)
+    import soundfile
+    samples, rate = soundfile.read(path, dtype='int16', always_2d=True)
+    return samples.mean(axis=1).astype(np.int16), rate
+
+class WavFileSource(ReplaySource):
+    """
+    Replays a 16-bit WAV file or a session audio archive.
+
+    Args:
+        path (str): Path to the audio file.
+        speed (float, optional): Replay pace as a multiple of real time, or None for unthrottled replay. Defaults to REPLAY_SPEED.
+    """
+
+    def __init__(self, path, speed=REPLAY_SPEED):
+        super().__init__(speed)
+        self.samples, self.rate = read_audio_file(path)
+
+    def blocks(self):
+        for start in range(0, len(self.samples), CHUNK):
+            yield self.samples[start:start + CHUNK]
+
+class ChunkDirectorySource(ReplaySource):
+    """
+    Replays a log_files/<session> directory recorded as one WAV file per chunk, before sessions were archived.
+
+    Each saved chunk holds the whole unpruned buffer at the time it was sent, so consecutive chunks
+    overlap. The overlap is found by matching the start of each chunk against the previous chunk,
+    and only the audio after it is replayed, which reproduces the original recording.
+
+    Args:
+        directory (str): Path to the session directory.
+        speed (float, optional): Replay pace as a multiple of real time, or None for unthrottled replay. Defaults to REPLAY_SPEED.
+    """
+
+    def __init__(self, directory, speed=REPLAY_SPEED):
+        super().__init__(speed)
+        self.paths = sorted((os.path.join(directory, name) for name in os.listdir(directory) if name.endswith('.wav')),
+                            key=lambda path: (os.path.getmtime(path), path))
+        if not self.paths:
+            raise ValueError(f'{directory} contains no recorded audio chunks')
+        self.rate = read_wav(self.paths[0])[1]
+
+    def blocks(self):
+        previous = np.zeros(0, dtype=np.int16)
+        for path in self.paths:
+            chunk = read_wav(path)[0]
+            new_audio = chunk[find_chunk_overlap(previous, chunk):]
+            for start in range(0, len(new_audio), CHUNK):
+                yield new_audio[start:start + CHUNK]
+            previous = chunk
+
+def find_chunk_overlap(previous, chunk, probe_length=CHUNK):
+    """
+    Find how many samples at the start of a chunk repeat the end of the previous chunk.
+
+    Args:
+        previous (ndarray): Samples of the previous chunk.
+        chunk (ndarray): Samples of the chunk.
+        probe_length (int, optional): Number of samples used to search for candidate overlaps. Defaults to CHUNK.
+
+    Returns:
+        int: Length of the overlap, 0 if the chunk does not start inside the previous chunk.
+    """
+    probe = chunk[:probe_length].tobytes()
+    haystack = previous.tobytes()
+    position = haystack.find(probe)
+    while position != -1:
+        start = position // previous.itemsize
+        overlap = len(previous) - start
+        if position % previous.itemsize == 0 and overlap <= len(chunk) and np.array_equal(previous[start:], chunk[:overlap]):
+            return overlap
+        position = haystack.find(probe, position + 1)
+    return 0
+
+def open_audio_sources(sources=AUDIO_SOURCES):
+    """
+    Create the audio sources selected by AUDIO_SOURCES, one per capture stream.
+
+    Args:
+        sources (list, optional): None to record from every device in device_ids, or the paths of audio files and
+            session directories to replay. Defaults to AUDIO_SOURCES.
+
+    Returns:
+        list: The opened AudioSources, one per stream.
+    """
+    if sources is None:
+        return [LiveAudioSource(device_index) for device_index in device_ids]
+    audio_sources = []
+    for source in sources:
+        if not os.path.isdir(source):
+            audio_sources.append(WavFileSource(source))
+            continue
+        # A session directory replays each of its archived streams, or its chunk files if it predates archiving
+        archives = sorted(os.path.join(source, name) for name in os.listdir(source)
+                          if name.startswith('audio_stream_') and name.endswith(tuple(ARCHIVE_EXTENSIONS.values())))
+        audio_sources.extend([WavFileSource(archive) for archive in archives] or [ChunkDirectorySource(source)])
+    return audio_sources
+
+class ChunkBudget:
+    """
+    Token bucket that limits the chunks a stream sends to model_server, measured in seconds of captured audio.
+
+    Regular chunks are always sent and take a token even when the bucket is empty, which delays the
+    following early chunks, so on average a stream never sends more than rate chunks per second.
+
+    Args:
+        rate (float, optional): Tokens added per second of audio. Defaults to CHUNK_BUDGET.
+        burst (int, optional): Most tokens the bucket holds. Defaults to CHUNK_BURST.
+    """
+
+    def __init__(self, rate=CHUNK_BUDGET, burst=CHUNK_BURST):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.time = None
+
+    def take(self, now, force=False):
+        """
+        Take a token for a chunk.
+
+        Args:
+            now (float): Seconds of audio processed so far.
+            force (bool, optional): Take a token even if none is left. Defaults to False.
+
+        Returns:
+            bool: True if the chunk may be sent.
+        """
+        if self.time is not None:
+            self.tokens = min(self.burst, self.tokens + (now - self.time) * self.rate)
+        self.time = now
+        if self.tokens < 1 and not force:
+            return False
+        self.tokens = max(self.tokens - 1, -self.burst)
+        return True
+
+class CaptureStream:
+    """
+    Capture and chunking state of one audio source, identified by its stream ID on every chunk it produces.
+
+    Each stream has its own shared audio buffer, VAD and prune state, so several microphones can be
+    captured at once while feeding a single transcription backend.
+
+    Args:
+        stream_id (int): ID of the stream, its index in the list of capture streams.
+        source (AudioSource): The audio source of the stream.
+        data_ready (Event): Event set whenever the source delivers new audio, shared by all streams.
+        repository_path (str): The session directory the stream's audio is archived in.
+        log_queue (Queue): Queue for logging information.
+    """
+
+    def __init__(self, stream_id, source, data_ready, repository_path, log_queue):
+        self.stream_id = stream_id
+        self.source = source
+        #audio_buffer holds the current audio chunk, resampled to MODEL_RATE as it is captured
+        # It is shared with model_server, only descriptors go through the worker pool
+        self.audio_buffer = AudioRingBuffer(RING_BUFFER_LENGTH * MODEL_RATE, dtype=np.float32, shared=True)
+        self.capture = AudioCapture(self.audio_buffer, source.rate, data_ready)
+        self.archiver = AudioArchiver(self.audio_buffer, os.path.join(repository_path, f'audio_stream_{stream_id}'), log_queue)
+        vad_parameters = VadOptions(threshold=VAD_THRESHOLD, min_speech_duration_ms=VAD_MIN_SPEECH_MS, min_silence_duration_ms=VAD_MIN_SILENCE_MS,
+                                    window_size_samples=VAD_WINDOW)
+        self.streaming_vad = StreamingVad(vad_parameters)
+        # [start, end] absolute sample ranges of the speech found by the VAD, end is None while the speech goes on
+        self.speech_regions = []
+        self.energy_gate = EnergyGate()
+        # Whether any audio since the last chunk got past the energy gate, and the chunks skipped because none did
+        self.heard_audio = False
+        self.skipped_chunks = 0
+        # Chunks sent longer than MAX_BUFFER_SECONDS because model_server's prune had not arrived yet
+        self.oversized_chunks = 0
+        # Sample of the last speech onset no chunk was sent after yet, and the chunks sent ahead of the regular ones
+        self.onset_sample = None
+        # Sample at which the last speech ended, until the utterance is finalized, and whether it was since
+        self.endpoint_sample = None
+        self.finalized = False
+        self.final_chunks = 0
+        self.chunk_budget = ChunkBudget()
+        self.onset_chunks = 0
+        self.cadence_chunks = 0
+        self.onset_delays = []
+        self.silence = False
+        self.speech = False
+        self.reference_time = 0
+        self.stats_time = 0
+        self.sequence = 0
+
+    def start(self):
+        self.capture.processed_cursor = self.audio_buffer.write_cursor
+        self.archiver.start(self.audio_buffer.write_cursor)
+        self.source.start(self.capture)
+
+    def process(self, input_queue, log_queue):
+        """
+        Run VAD over the audio captured since the last call and send a chunk to model_server when one is due.
+
+        Args:
+            input_queue (WorkerPool): The worker pool to put ChunkDescriptors of the audio buffer into.
+            log_queue (queue): The queue to log events and messages.
+
+        Returns:
+            bool: False once the source has finished and all of its audio has been processed.
+        """
+        audio_buffer = self.audio_buffer
+        capture = self.capture
+        captured_cursor = audio_buffer.write_cursor
+        if captured_cursor == capture.processed_cursor:
+            return self.source.is_active()
+        if not audio_buffer.is_available(capture.processed_cursor):
+            lost_samples = captured_cursor - audio_buffer.capacity - capture.processed_cursor
+            capture.overrun_samples += lost_samples
+            self.streaming_vad.skip(lost_samples)
+            capture.processed_cursor += lost_samples
+        new_audio = audio_buffer.view(capture.processed_cursor, captured_cursor)
+        capture.processed_cursor = captured_cursor
+        # Calculate elapsed time
+        elapsed_time = capture.processed_cursor / MODEL_RATE
+
+        if elapsed_time - self.stats_time >= CAPTURE_STATS_INTERVAL:
+            self.stats_time = elapsed_time
+            capture.log_stats(log_queue, self.stream_id)
+            self.energy_gate.log_stats(log_queue, self.stream_id, self.skipped_chunks)
+
+        # Audio the energy gate marks as silent is not scored, unless the VAD is still inside speech and waiting for its end
+        if ENERGY_GATE and not self.energy_gate.process(new_audio) and not self.streaming_vad.triggered:
+            self.streaming_vad.skip(len(new_audio))
+            vad_events = []
+        else:
+            self.heard_audio = True
+            # Only the newly captured audio is scored, the VAD keeps its state between reads
+            vad_events = self.streaming_vad.process(new_audio)
+        for event, sample in vad_events:
+            log_queue.put(f'{datetime.datetime.now().strftime("%H:%M:%S")}|VAD_EVENT|stream={self.stream_id}|{event}|{sample / MODEL_RATE:.2f}')
+            if event == 'speech_start':
+                self.speech = True
+                self.speech_regions.append([sample, None])
+                self.onset_sample = sample
+                self.endpoint_sample = None
+                self.finalized = False
+            else:
+                self.silence = True
+                self.speech = False
+                if self.speech_regions and self.speech_regions[-1][1] is None:
+                    self.speech_regions[-1][1] = sample
+                self.endpoint_sample = sample
+        if not self.streaming_vad.triggered:
+            self.silence = True
+
+        # TODO Implement silence detection
+        # The silence flag is still set from before an onset, so with early chunks the speech-and-silence trigger would fire
+        # right after it, ahead of the onset chunk. Speech ends are sent by the final chunk after the hangover instead
+        regular_chunk = ((elapsed_time - self.reference_time >= AUDIO_CHUNK_LENGTH)
+                         or (not EARLY_CHUNKS and self.speech == True and self.silence == True))
+        # Early chunks are sent shortly after a speech onset, so the first words show up without waiting for a regular chunk,
+        # and during speech at a cadence that slows down as the stream's worker gets busy. The cadence only starts once the onset
+        # chunk is sent, the reference time before an onset is from the silence and would fire it right away
+        onset_chunk = self.onset_sample is not None and capture.processed_cursor >= self.onset_sample + ONSET_DELAY * MODEL_RATE
+        cadence_chunk = self.streaming_vad.triggered and self.onset_sample is None and elapsed_time - self.reference_time >= self.chunk_interval(input_queue.load(self.stream_id))
+        early_chunk = (EARLY_CHUNKS and not regular_chunk and self.heard_audio and (onset_chunk or cadence_chunk)
+                       and self.chunk_budget.take(elapsed_time))
+        # The endpoint fires once the speech has been over for ENDPOINT_HANGOVER_MS, the final chunk then confirms the utterance
+        final_chunk = (self.endpoint_sample is not None and not self.streaming_vad.triggered
+                       and capture.processed_cursor >= self.endpoint_sample + ENDPOINT_HANGOVER_MS * MODEL_RATE // 1000)
+        if regular_chunk or early_chunk or final_chunk:
+            
+            self.silence = False
+            # A chunk that only adds gated silence would get the same transcript as the last one, and after a
+            # finalized utterance the silence is dropped from the buffer until speech starts again
+            if self.finalized:
+                self.reference_time = elapsed_time
+                self.skipped_chunks += 1
+                audio_buffer.prune(capture.processed_cursor - VAD_SPEECH_PAD_MS * MODEL_RATE // 1000)
+                return True
+            if not self.heard_audio and not final_chunk:
+                self.reference_time = elapsed_time
+                self.skipped_chunks += 1
+                return True
+            self.heard_audio = False
+            if final_chunk:
+                self.chunk_budget.take(elapsed_time, force=True)
+                self.final_chunks += 1
+                self.endpoint_sample = None
+                self.finalized = True
+                log_queue.put(f'{datetime.datetime.now().strftime("%H:%M:%S")}|ENDPOINT|stream={self.stream_id}|at={elapsed_time:.2f}')
+            elif regular_chunk:
+                self.chunk_budget.take(elapsed_time, force=True)
+            elif onset_chunk:
+                self.onset_chunks += 1
+                log_queue.put(f'{datetime.datetime.now().strftime("%H:%M:%S")}|ONSET_CHUNK|stream={self.stream_id}'
+                              f'|onset={self.onset_sample / MODEL_RATE:.2f}')
+            else:
+                self.cadence_chunks += 1
+            if self.onset_sample is not None:
+                self.onset_delays.append((capture.processed_cursor - self.onset_sample) / MODEL_RATE)
+                self.onset_sample = None
+            chunk_id = f'AudioChunk_{self.stream_id}_{datetime.datetime.now().strftime("%H:%M:%S")}_{uuid.uuid4()}'
+            self.reference_time = elapsed_time
+            # Prepare the chunk for processing, up to the audio processed so far since the callback keeps writing
+            chunk_start = audio_buffer.read_cursor
+            # model_server force-commits before chunks reach MAX_BUFFER_SECONDS. A chunk sent before its prune arrived is
+            # still sent whole, the audio ahead of the cap has not been committed and an earlier chunk holding it may have
+            # been coalesced away. Its transcription force-commits up to a word boundary and prunes the buffer
+            if capture.processed_cursor - chunk_start > MAX_BUFFER_SECONDS * MODEL_RATE:
+                self.oversized_chunks += 1
+                log_queue.put(f'{datetime.datetime.now().strftime("%H:%M:%S")}|{chunk_id}|OVERSIZED_CHUNK|stream={self.stream_id}'
+                              f'|chunk_seconds={(capture.processed_cursor - chunk_start) / MODEL_RATE:.2f}')
+            processing_samples = audio_buffer.view(chunk_start, capture.processed_cursor)
+
+            # The chunk is archived as a reference into the stream's archive, which the archiver thread writes
+            self.archiver.add_chunk(chunk_id, chunk_start, len(processing_samples))
+
+            # Only the location of the chunk and its speech regions are sent, model_server reads the audio from shared memory
+            speech_regions = self.chunk_speech_regions(chunk_start, capture.processed_cursor)
+            input_queue.put(ChunkDescriptor(audio_buffer.name, chunk_start, len(processing_samples), self.sequence, chunk_id,
+                                            self.stream_id, time.time(), speech_regions, final_chunk))
+            capture.sent_sequence = self.sequence
+            self.sequence += 1
+        return True
+
+    def chunk_interval(self, load):
+        """
+        Get the seconds between chunks during speech for the busy fraction of the stream's worker.
+
+        Args:
+            load (float): Busy fraction of the worker serving the stream.
+
+        Returns:
+            float: MIN_CHUNK_INTERVAL up to a load of CADENCE_LOAD_LOW, growing to AUDIO_CHUNK_LENGTH at full load.
+        """
+        pressure = min(max((load - CADENCE_LOAD_LOW) / (1 - CADENCE_LOAD_LOW), 0.0), 1.0)
+        return MIN_CHUNK_INTERVAL + (AUDIO_CHUNK_LENGTH - MIN_CHUNK_INTERVAL) * pressure
+
+    def log_chunk_stats(self, log_queue):
+        """
+        Log the early and final chunks sent and how long after a speech onset the first chunk covering it was sent.
+
+        Args:
+            log_queue (Queue): Queue for logging information.
+
+        Returns:
+            None
+        """
+        mean_onset_delay = np.mean(self.onset_delays) if self.onset_delays else 0.0
+        log_queue.put(f'{datetime.datetime.now().strftime("%H:%M:%S")}|CHUNK_STATS|stream={self.stream_id}|chunks={self.sequence}'
+                      f'|onset_chunks={self.onset_chunks}|cadence_chunks={self.cadence_chunks}|final_chunks={self.final_chunks}'
+                      f'|onsets={len(self.onset_delays)}'
+                      f'|mean_onset_delay={mean_onset_delay:.2f}')
+
+    def chunk_speech_regions(self, chunk_start, chunk_end):
+        """
+        Get the speech regions the VAD found in a chunk, so model_server does not have to run the VAD over it again.
+
+        Args:
+            chunk_start (int): Absolute sample index of the first sample of the chunk.
+            chunk_end (int): Absolute sample index after the last sample of the chunk.
+
+        Returns:
+            tuple: (start, end) sample ranges relative to the chunk, padded by VAD_SPEECH_PAD_MS and merged where the padding overlaps.
+        """
+        pad = VAD_SPEECH_PAD_MS * MODEL_RATE // 1000
+        # Regions that ended before the chunk are not needed again, chunks only move forward
+        self.speech_regions = [region for region in self.speech_regions if region[1] is None or region[1] + pad > chunk_start]
+        regions = []
+        for start, end in self.speech_regions:
+            start = max(start - pad, chunk_start) - chunk_start
+            end = (chunk_end if end is None else min(end + pad, chunk_end)) - chunk_start
+            if end <= start:
+                continue
+            if regions and start <= regions[-1][1]:
+                regions[-1] = (regions[-1][0], max(regions[-1][1], end))
+            else:
+                regions.append((start, end))
+        return tuple(regions)
+
+    def close(self):
+        """
+        Close the source, finish the archive and destroy the shared audio buffer. Only call this once model_server has stopped reading it.
+
+        Returns:
+            None
+        """
+        self.source.close()
+        self.archiver.close()
+        self.audio_buffer.close(unlink=True)
+
+#- End Audio source classes -#
+
+###############################################################################################
+
 #- Audio processing functions -#
 
-def process_audio_chunk(frames, sample_width):
+def pcm_to_float32(samples):
     """
-    Process audio frames and convert them into a wav file-like BytesIO object.
+    Convert int16 PCM samples into normalized float32 samples in the range [-1, 1).
 
     Args:
-        frames (list): List of audio frames.
-        sample_width (int): Width of each audio sample in bytes.
+        samples (ndarray): Array of int16 audio samples.
 
     Returns:
-        BytesIO: Wav file-like BytesIO object containing the processed audio.
+        ndarray: Array of float32 audio samples.
+    """
+    return np.multiply(samples, 1 / 32768, dtype=np.float32)
 
+@functools.lru_cache
+def design_resampling_filter(up, down, taps_per_phase=RESAMPLER_TAPS):
     """
-    wav_stream = io.BytesIO()
-    with wave.open(wav_stream, 'wb') as wf:
-        wf.setnchannels(CHANNELS)
-        wf.setsampwidth(sample_width)
-        wf.setframerate(RATE)
-        for frame in frames:
-            wf.writeframes(frame)
-    wav_stream.seek(0)
-    return wav_stream
+    Design the polyphase low-pass filter used to resample by a rational factor of up/down.
 
-def save_audio_chunk(frames, sample_width, logger_queue, chunk_id, repository_path):
+    Args:
+        up (int): Upsampling factor.
+        down (int): Downsampling factor.
+        taps_per_phase (int, optional): Number of filter taps in each polyphase branch when upsampling, scaled by
+            down/up when downsampling. Defaults to RESAMPLER_TAPS.
+
+    Returns:
+        ndarray: Array of shape (up, taps per branch) holding one time-reversed filter branch per phase,
+            so that a branch can be applied directly to a window of input samples in chronological order.
+    """
+    # The transition band is set at the lower of the two rates, so the filter grows with max(up, down) as in
+    # scipy's resample_poly. Each branch then covers taps_per_phase samples at the lower rate
+    branch_taps = math.ceil(taps_per_phase * max(up, down) / up)
+    num_taps = branch_taps * up
+    # Cut off just below the lower of the two Nyquist frequencies, expressed relative to the upsampled rate
+    cutoff = RESAMPLER_CUTOFF * 0.5 / max(up, down)
+    n = np.arange(num_taps) - (num_taps - 1) / 2
+    prototype = 2 * cutoff * np.sinc(2 * cutoff * n) * np.kaiser(num_taps, 8.0)
+
+    branches = prototype.reshape(branch_taps, up).T
+    branches = branches / branches.sum(axis=1, keepdims=True)
+    return np.ascontiguousarray(branches[:, ::-1], dtype=np.float32)
+
+def float32_to_pcm(audio):
     """
-    Save audio chunk as a WAV file.
+    Convert normalized float32 samples back into int16 PCM samples.
 
     Args:
-        frames (list): List of audio frames.
-        sample_width (int): Sample width in bytes.
-        logger_queue (Queue): Queue for logging messages.
-        chunk_id (str): ID of the audio chunk.
-        repository_path (str): Path to the repository.
+        audio (ndarray): Array of float32 audio samples.
 
     Returns:
-        None
+        ndarray: Array of int16 audio samples.
     """
-    file_name = f"{repository_path}/{chunk_id}.wav"
-    wf = wave.open(file_name, 'wb')
-    wf.setnchannels(CHANNELS)
-    wf.setsampwidth(sample_width)
-    wf.setframerate(RATE)
-    wf.writeframes(b''.join(frames))
-    wf.close()   
-    logger_queue.put(f'{datetime.datetime.now().strftime("%H:%M:%S")}|{chunk_id}|SAVED_AUDIO_CHUNK|{file_name}')
+    return np.clip(audio * 32768, -32768, 32767).astype(np.int16)
+
+def resample_audio(audio, orig_rate, target_rate=MODEL_RATE):
+    """
+    Resample a complete float32 recording with a vectorized polyphase filter.
+
+    Args:
+        audio (ndarray): One dimensional array of float32 samples.
+        orig_rate (int): Sample rate of the input audio.
+        target_rate (int, optional): Sample rate of the output audio. Defaults to MODEL_RATE.
+
+    Returns:
+        ndarray: Array of float32 samples at target_rate.
+    """
+    return StreamingResampler(orig_rate, target_rate).process(audio)
 
 # start recording_overlap handles reading the data from audio stream and feeding it to the transcription pipeline
 # TODO Change chunking behaviour to be based off of sentence content.  This requires getting transcriptions back from the model server
-def process_stream(stream, sample_width, input_queue, buffer_prune_queue, log_queue, repository_path):
+def process_stream(capture_streams, data_ready, worker_pool, buffer_prune_queue, log_queue):
     """
-    Process the audio stream in chunks and perform necessary operations on each chunk.
+    Process the audio streams in chunks and perform necessary operations on each chunk.
+
+    Capture runs in the callbacks of the audio sources, this function only processes what the callbacks have written
+    to the audio buffers. It returns when the user stops recording or every replayed source runs out of audio.
 
     Args:
-        stream (audio stream): The audio stream to process.
-        sample_width (int): The sample width of the audio stream.
-        input_queue (queue): The queue to put processed audio chunks into.
-        buffer_prune_queue (queue): The queue to receive prune signals for audio buffer.
+        capture_streams (list): The CaptureStreams to process, indexed by stream ID.
+        data_ready (Event): The event set by the capture callbacks whenever new audio is written.
+        worker_pool (WorkerPool): The transcription workers to send ChunkDescriptors of the audio buffers to.
+        buffer_prune_queue (queue): The queue to receive (stream ID, absolute sample position) prune signals for the audio buffers.
         log_queue (queue): The queue to log events and messages.
-        repository_path (str): The path to the repository.
 
     Returns:
         None
     """
 
     start_time=datetime.datetime.now().strftime("%H:%M:%S")   
-    log_queue.put(f'{start_time}|STARTED_RECORDING|')
-    get_vad_model()
-    #frames holds the current audio chunk
-    current_frames = []
-    silence = False
-    speech = False
-
-    vad_parameters = VadOptions(threshold=0.6, max_speech_duration_s=20)
+    log_queue.put(f'{start_time}|STARTED_RECORDING|{len(capture_streams)}')
     
     try:
         print("###---Begin recording.---###")
 
-        reference_time = 0
+        wall_start = time.perf_counter()
+        for capture_stream in capture_streams:
+            capture_stream.start()
         while True:
-            data = stream.read(CHUNK, exception_on_overflow=False)
-            current_frames.append(data)
-            # Calculate elapsed time
-            elapsed_time = len(current_frames) * CHUNK / RATE
-            if elapsed_time - reference_time >= SILENCE_CHUNK_LENGTH:
-                
-                wav_stream = process_audio_chunk(current_frames, sample_width)
-
-                decoded_audio= decode_audio(wav_stream)
-                speech_chunks = get_speech_timestamps(audio=decoded_audio, vad_options=vad_parameters)
-                #speech_chunks = get_speech_timestamps(audio= np.frombuffer(b''.join(current_frames), dtype=np.float32), vad_options=vad_parameters)
-                print(f'speech_chunks: {speech_chunks}')
-                if len(speech_chunks) == 0:
-                    silence = True
-                    speech = False
-                else:
-                    speech = True
-                
-
-            # TODO Implement silence detection
-            if (elapsed_time - reference_time >= AUDIO_CHUNK_LENGTH) or (speech == True and silence == True):
-                
-                silence = False
-                chunk_id = f'AudioChunk_{datetime.datetime.now().strftime("%H:%M:%S")}_{uuid.uuid4()}'
-                #buffer_prune queue will get pushed to it the time where the audio buffer should be pruned when its appropriate
-                #TODO: Implement sentinel value for checking queue emptyness instead of .empty()?
-                if not buffer_prune_queue.empty():
-                    #TODO: profile how long it takes to prune the buffer with list slicing
-                    prune_signal = buffer_prune_queue.get()
-                    current_frames = current_frames[int(prune_signal * RATE / CHUNK):]
-                
-                reference_time = elapsed_time
-                # Prepare the chunk for processing
-                processing_frames = current_frames
-
-                # Process the chunk
-                wav_stream = process_audio_chunk(processing_frames, sample_width)
-                save_audio_chunk(processing_frames, sample_width, log_queue, chunk_id, repository_path)
-
-                input_queue.put((wav_stream, chunk_id))
-                
+            data_ready.wait(timeout=1)
+            data_ready.clear()
+
+            #buffer_prune queue will get pushed to it the position where an audio buffer should be pruned when its appropriate
+            #TODO: Implement sentinel value for checking queue emptyness instead of .empty()?
+            while not buffer_prune_queue.empty():
+                stream_id, prune_position = buffer_prune_queue.get()
+                capture_streams[stream_id].audio_buffer.prune(prune_position)
+
+            worker_pool.rebalance()
+            for capture_stream in capture_streams:
+                capture_stream.capture.transcribed_sequence = worker_pool.transcribed.get(capture_stream.stream_id, -1)
+            active_streams = [capture_stream.process(worker_pool, log_queue) for capture_stream in capture_streams]
+            if not any(active_streams):
+                break
                 
     except KeyboardInterrupt:
         print("\nRecording stopped by user.")
-        return
+
+    # The ratio of audio to wall time is the sustained throughput when replaying as fast as possible, the replay then waits
+    # for each chunk to be transcribed before it delivers more audio
+    for capture_stream in capture_streams:
+        capture_stream.capture.log_stats(log_queue, capture_stream.stream_id)
+        capture_stream.energy_gate.log_stats(log_queue, capture_stream.stream_id, capture_stream.skipped_chunks)
+        capture_stream.log_chunk_stats(log_queue)
+        log_queue.put(f'{datetime.datetime.now().strftime("%H:%M:%S")}|STOPPED_RECORDING|stream={capture_stream.stream_id}'
+                      f'|audio_seconds={capture_stream.capture.processed_cursor / MODEL_RATE:.2f}|wall_seconds={time.perf_counter() - wall_start:.2f}'
+                      f'|oversized_chunks={capture_stream.oversized_chunks}')
         
 #- End Audio processing functions -#
 
@@ -400,62 +3311,80 @@ def profile_logger():
 #- End Profiling functions -#
 def main():
 
+    startup_start = time.perf_counter()
     ###---------Setup Logging---------###
     session_id = f'{datetime.datetime.now().strftime("%Y-%m-%d_%H:%M:%S")}_{uuid.uuid4()}'
     repository_path = f"log_files/{session_id}"
     os.makedirs(repository_path, exist_ok=True)
     ###---------End Setup Logging---------###
 
-    ###---------Setup Audio Stream---------###
-    pa = pyaudio.PyAudio()
-    sample_width = pa.get_sample_size(FORMAT)
-    stream = pa.open(format=FORMAT,
-                    channels=CHANNELS,
-                    rate=RATE,
-                    input=True,
-                    input_device_index=device_id,
-                    frames_per_buffer=CHUNK)
-    ###---------End Setup Audio Stream---------###
-
     ###--------- Multiprocessing Setup ---------###
-    input_queue = multiprocessing.Queue()
     output_queue = multiprocessing.Queue()
     buffer_prune_queue = multiprocessing.Queue()
     log_queue = multiprocessing.Queue()
 
-    server_process = multiprocessing.Process(target=model_server, args=(input_queue, output_queue, buffer_prune_queue, log_queue))
+    worker_pool = WorkerPool(output_queue, buffer_prune_queue, log_queue)
     display_process = multiprocessing.Process(target=output_transcript, args=(output_queue,session_id,))
     #display_process = multiprocessing.Process(target=output_to_window, args=(output_queue,))
 
     log_process = multiprocessing.Process(target=logger, args=(log_queue,repository_path,))
 
-    server_process.start()
+    worker_pool.start()
     display_process.start()
     log_process.start()
     ###--------- End Multiprocessing Setup ---------###
 
-    #Wait for user input to start recording
-    input("Program started. Press any key to start recording.  Press Ctrl+C to stop.")
-    output_queue.put((str(0),"Beginning transcription! \n",""))
-    process_stream(stream, sample_width, input_queue, buffer_prune_queue, log_queue, repository_path)
-
-    #send custom chunk id
-    input_queue.put((None,f'termination_chunk_{datetime.datetime.now().strftime("%Y-%m-%d_%H:%M:%S")}_{uuid.uuid4()}'))  # Signal model process to shut down
-    log_queue.put(None)
-    output_queue.put(None)  # Signal display process to shut down
-
-
-    server_process.join()
-    display_process.join()
-    log_process.join()
-    #Cleanup 
-    server_process.terminate()
-    display_process.terminate()
-    log_process.terminate()
-
-    stream.stop_stream()
-    stream.close()
-    pa.terminate()
+    # A failure or Ctrl+C before recording stops still shuts every process down and frees the audio streams and shared
+    # memory, the children ignore Ctrl+C and would otherwise keep the program waiting on their queues
+    capture_streams = []
+    try:
+        ###---------Setup Audio Stream---------###
+        # One capture stream per microphone or replayed recording, all feeding the same worker pool
+        # The audio sources are opened while the workers load their models
+        audio_start = time.perf_counter()
+        data_ready = threading.Event()
+        for stream_id, source in enumerate(open_audio_sources()):
+            capture_streams.append(CaptureStream(stream_id, source, data_ready, repository_path, log_queue))
+        audio_seconds = time.perf_counter() - audio_start
+        # The capture VAD is warmed up while the workers are still loading
+        vad_start = time.perf_counter()
+        warm_up_streaming_vad()
+        vad_seconds = time.perf_counter() - vad_start
+        ###---------End Setup Audio Stream---------###
+
+        # Recording only starts once every worker is ready, so the first chunks do not queue up behind model loading
+        worker_stages = worker_pool.wait_ready()
+        startup_seconds = time.perf_counter() - startup_start
+        log_queue.put(f'{datetime.datetime.now().strftime("%H:%M:%S")}|STARTUP|audio_sources={audio_seconds:.3f}|capture_vad={vad_seconds:.3f}|'
+                      + '|'.join(f'worker_{stage}={seconds:.3f}' for stage, seconds in worker_stages.items()) + f'|ready={startup_seconds:.3f}')
+        print(f'Startup took {startup_seconds:.2f} s: audio sources {audio_seconds:.2f} s, capture VAD {vad_seconds:.2f} s, slowest worker '
+              + ', '.join(f'{stage} {seconds:.2f} s' for stage, seconds in worker_stages.items()))
+
+        #Wait for user input to start recording
+        prompt_start = time.perf_counter()
+        input("Program started. Press any key to start recording.  Press Ctrl+C to stop.")
+        # The time to the first transcript is measured from here, without the wait at the prompt
+        worker_pool.start_recording()
+        log_queue.put(f'{datetime.datetime.now().strftime("%H:%M:%S")}|PROMPT_WAIT|seconds={time.perf_counter() - prompt_start:.3f}')
+        for capture_stream in capture_streams:
+            output_queue.put(TranscriptUpdate(str(0), "Beginning transcription! \n", "", capture_stream.stream_id))
+        process_stream(capture_streams, data_ready, worker_pool, buffer_prune_queue, log_queue)
+
+    finally:
+        # Signal the model processes to shut down
+        # model_server finishes the chunks already queued before it stops, so its output and logs are flushed first
+        worker_pool.close()
+        # The archives are finished before the logger stops, so their closing reports are logged
+        for capture_stream in capture_streams:
+            capture_stream.close()
+        log_queue.put(None)
+        output_queue.put(None)  # Signal display process to shut down
+
+        display_process.join()
+        log_process.join()
+        #Cleanup 
+        display_process.terminate()
+        log_process.terminate()
 
 ######------ End Functions ------###### 
 
@@ -0,0 +1,60 @@
+import io
+import os
+import sys
+import time
+import wave
+
+import numpy as np
+from faster_whisper.audio import decode_audio
+
+# Benchmarks the per-chunk CPU cost of preparing audio for the VAD and whisper models.
+# The BytesIO path is the one s2t.py used before switching to raw arrays: the frames were
+# wrapped in a WAV container, then decoded and resampled by PyAV on the VAD tick and again
+# inside model.transcribe.  The array path converts each captured CHUNK and resamples it once
+# with the streaming resampler, which is all the work s2t.py now does for a buffer of that length.
+# Usage: python s2t_array_path_benchmark.py [recording.wav]
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from s2t import CHUNK, StreamingResampler, pcm_to_float32
+
+###--- Benchmark parameters ---###
+RATE = 48000 # Capture rate of the simulated input device
+CHUNK_LENGTHS = [4, 8, 16, 30] # Buffer lengths in seconds
+REPEATS = 20
+###--- End Benchmark parameters ---###
+
+def bytesio_path(samples):
+    wav_stream = io.BytesIO()
+    with wave.open(wav_stream, 'wb') as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(RATE)
+        wf.writeframes(samples)
+    wav_stream.seek(0)
+    return decode_audio(wav_stream)
+
+def array_path(samples):
+    resampler = StreamingResampler(RATE)
+    return [resampler.process(pcm_to_float32(samples[i:i + CHUNK])) for i in range(0, len(samples), CHUNK)]
+
+def load_samples(length):
+    if len(sys.argv) > 1:
+        with wave.open(sys.argv[1], 'rb') as wf:
+            recording = np.frombuffer(wf.readframes(wf.getnframes()), dtype=np.int16)
+        return np.resize(recording, length * RATE)
+    rng = np.random.default_rng(0)
+    return (rng.standard_normal(length * RATE) * 3000).astype(np.int16)
+
+def measure(function, samples):
+    start = time.process_time()
+    for _ in range(REPEATS):
+        function(samples)
+    return (time.process_time() - start) / REPEATS
+
+print(f'{"chunk (s)":>10} {"BytesIO (ms)":>14} {"array (ms)":>12} {"saved (ms)":>12}')
+for length in CHUNK_LENGTHS:
+    samples = load_samples(length)
+    # The BytesIO path decoded every chunk twice: once for the VAD tick and once inside model.transcribe
+    bytesio_time = 2 * measure(bytesio_path, samples)
+    array_time = measure(array_path, samples)
+    print(f'{length:>10} {bytesio_time * 1000:>14.2f} {array_time * 1000:>12.2f} {(bytesio_time - array_time) * 1000:>12.2f}')
@@ -0,0 +1,69 @@
+import os
+import sys
+import time
+
+import numpy as np
+from faster_whisper import WhisperModel
+
+# Compares full 30 s audio context against the reduced context of REDUCED_AUDIO_CONTEXT on a replay corpus.
+# Each recording is cut into windows of the lengths model_server typically transcribes, and every
+# window is transcribed with both contexts.  The report gives the real-time factor of each mode and
+# the word error rate of the reduced context, against a reference transcript stored next to the
+# recording as <name>.txt, or against the full context output when there is none.
+# Usage: python s2t_audio_context_benchmark.py <recording or directory> [...]
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from s2t import MODEL_RATE, ARCHIVE_EXTENSIONS, audio_context_length, pcm_to_float32, read_audio_file, resample_audio
+
+###--- Benchmark parameters ---###
+MODEL_SIZE = "tiny.en"
+WINDOW_SECONDS = [4, 8, 16] # Lengths of the transcribed windows
+###--- End Benchmark parameters ---###
+
+def corpus_files(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            yield from sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith(tuple(ARCHIVE_EXTENSIONS.values())))
+        else:
+            yield path
+
+def word_error_rate(reference, hypothesis):
+    reference = reference.lower().split()
+    hypothesis = hypothesis.lower().split()
+    distances = np.arange(len(hypothesis) + 1)
+    for i, reference_word in enumerate(reference, 1):
+        previous = distances.copy()
+        distances[0] = i
+        for j, hypothesis_word in enumerate(hypothesis, 1):
+            distances[j] = min(previous[j] + 1, distances[j - 1] + 1, previous[j - 1] + (reference_word != hypothesis_word))
+    return distances[-1] / max(len(reference), 1)
+
+def transcribe_windows(model, audio, window_seconds, reduced_context):
+    texts = []
+    start = time.process_time()
+    for offset in range(0, len(audio), window_seconds * MODEL_RATE):
+        window = audio[offset:offset + window_seconds * MODEL_RATE]
+        chunk_length = audio_context_length(model, len(window) / MODEL_RATE, reduced_context)
+        segments, info = model.transcribe(window, beam_size=5, vad_filter=True, word_timestamps=True, chunk_length=chunk_length)
+        texts.extend(segment.text for segment in segments)
+    return ' '.join(texts), time.process_time() - start
+
+if __name__ == "__main__":
+    model = WhisperModel(MODEL_SIZE, device="cpu", compute_type="int8")
+    print(f'{"recording":>30} {"window (s)":>10} {"full RTF":>9} {"reduced RTF":>12} {"full WER":>9} {"reduced WER":>12}')
+    for path in corpus_files(sys.argv[1:]):
+        samples, rate = read_audio_file(path)
+        audio = resample_audio(pcm_to_float32(samples), rate)
+        audio_seconds = len(audio) / MODEL_RATE
+        reference_path = os.path.splitext(path)[0] + '.txt'
+        reference = open(reference_path).read() if os.path.exists(reference_path) else None
+        for window_seconds in WINDOW_SECONDS:
+            full_text, full_time = transcribe_windows(model, audio, window_seconds, False)
+            try:
+                reduced_text, reduced_time = transcribe_windows(model, audio, window_seconds, True)
+            except ValueError as error:
+                sys.exit(f'The installed CTranslate2 encoder does not accept reduced audio contexts: {error}')
+            full_wer = word_error_rate(reference, full_text) if reference is not None else 0.0
+            reduced_wer = word_error_rate(reference if reference is not None else full_text, reduced_text)
+            print(f'{os.path.basename(path)[-30:]:>30} {window_seconds:>10} {full_time / audio_seconds:>9.4f} {reduced_time / audio_seconds:>12.4f}'
+                  f' {full_wer:>9.3f} {reduced_wer:>12.3f}')
@@ -0,0 +1,65 @@
+import os
+import sys
+import time
+
+import numpy as np
+from faster_whisper import WhisperModel
+from faster_whisper.audio import pad_or_trim
+
+# Compares the throughput of model_server's one-at-a-time path, one model.transcribe call per chunk,
+# with the batched path, which runs the encoder, decoder and word alignment once for the chunks of
+# several streams.  Both paths get the same chunks without VAD filtering, so only inference is timed.
+# Throughput is reported per core: CPU time is measured rather than wall time.
+# Usage: python s2t_batched_inference_benchmark.py [recording.wav]
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from s2t import MODEL_RATE, AUDIO_CHUNK_LENGTH, decode_batch, pcm_to_float32, read_audio_file, resample_audio
+
+###--- Benchmark parameters ---###
+MODEL_SIZE = "tiny.en"
+CPU_THREADS = 4
+BATCH_SIZES = [1, 2, 4, 8]
+CHUNK_SECONDS = 2 * AUDIO_CHUNK_LENGTH # Length of the chunk of each stream
+REPEATS = 3
+###--- End Benchmark parameters ---###
+
+def load_chunks(count):
+    if len(sys.argv) > 1:
+        samples, rate = read_audio_file(sys.argv[1])
+        audio = np.resize(resample_audio(pcm_to_float32(samples), rate), count * CHUNK_SECONDS * MODEL_RATE)
+    else:
+        rng = np.random.default_rng(0)
+        audio = (rng.standard_normal(count * CHUNK_SECONDS * MODEL_RATE) * 0.05).astype(np.float32)
+    # Each stream gets a different part of the recording
+    return np.split(audio, count)
+
+def sequential_path(model, chunks):
+    for chunk in chunks:
+        segments, info = model.transcribe(chunk, beam_size=5, vad_filter=False, word_timestamps=True)
+        for segment in segments:
+            pass
+
+def batched_path(model, chunks):
+    features = []
+    num_frames = []
+    for chunk in chunks:
+        chunk_features = model.feature_extractor(chunk)
+        frames = chunk_features.shape[-1] - model.feature_extractor.nb_max_frames
+        features.append(pad_or_trim(chunk_features[:, :frames], model.feature_extractor.nb_max_frames))
+        num_frames.append(frames)
+    decode_batch(model, features, num_frames)
+
+def measure(function, model, chunks):
+    start = time.process_time()
+    for _ in range(REPEATS):
+        function(model, chunks)
+    return (time.process_time() - start) / REPEATS
+
+if __name__ == "__main__":
+    model = WhisperModel(MODEL_SIZE, device="cpu", compute_type="int8", cpu_threads=CPU_THREADS)
+    print(f'{"batch":>6} {"sequential (chunks/cpu-s)":>26} {"batched (chunks/cpu-s)":>23} {"gain":>6}')
+    for batch_size in BATCH_SIZES:
+        chunks = load_chunks(batch_size)
+        sequential_time = measure(sequential_path, model, chunks)
+        batched_time = measure(batched_path, model, chunks)
+        print(f'{batch_size:>6} {batch_size / sequential_time:>26.3f} {batch_size / batched_time:>23.3f} {sequential_time / batched_time:>6.2f}')
@@ -0,0 +1,69 @@
+import multiprocessing
+import os
+import sys
+import time
+
+import numpy as np
+from faster_whisper import WhisperModel
+
+# Measures how the aggregate real-time factor of s2t.py's worker pool scales with WORKER_COUNT.
+# Every worker loads its own model, like a model_server process, with the host's cores split
+# evenly between workers through cpu_threads, and transcribes the same recording REPEATS times.
+# Model loading is excluded: the workers wait on a barrier before the clock starts.
+# Aggregate RTF is wall time divided by the total audio transcribed by all workers, so below
+# 1 / streams the pool keeps up with that many live streams.
+# Usage: python s2t_worker_pool_benchmark.py [recording.wav]
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from s2t import MODEL_RATE, AUDIO_CHUNK_LENGTH, WORKER_NUM_WORKERS, pcm_to_float32, read_audio_file, resample_audio
+
+###--- Benchmark parameters ---###
+MODEL_SIZE = "tiny.en"
+WORKER_COUNTS = [1, 2, 4, 8] # Pool sizes to measure, capped at the number of cores
+CHUNK_SECONDS = 4 * AUDIO_CHUNK_LENGTH # Length of the transcribed chunk
+REPEATS = 5
+###--- End Benchmark parameters ---###
+
+def load_audio():
+    if len(sys.argv) > 1:
+        samples, rate = read_audio_file(sys.argv[1])
+        audio = resample_audio(pcm_to_float32(samples), rate)
+        return np.resize(audio, CHUNK_SECONDS * MODEL_RATE)
+    rng = np.random.default_rng(0)
+    return (rng.standard_normal(CHUNK_SECONDS * MODEL_RATE) * 0.05).astype(np.float32)
+
+def worker(audio, cpu_threads, barrier, results):
+    model = WhisperModel(MODEL_SIZE, device="cpu", compute_type="int8", cpu_threads=cpu_threads, num_workers=WORKER_NUM_WORKERS)
+    barrier.wait()
+    for _ in range(REPEATS):
+        segments, info = model.transcribe(audio, beam_size=5, vad_filter=True, word_timestamps=True)
+        for segment in segments:
+            pass
+    results.put(time.perf_counter())
+
+def measure(worker_count, audio):
+    cpu_threads = max(1, os.cpu_count() // worker_count)
+    # The extra party is this process, which starts the clock once every model is loaded
+    barrier = multiprocessing.Barrier(worker_count + 1)
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=worker, args=(audio, cpu_threads, barrier, results)) for _ in range(worker_count)]
+    for process in processes:
+        process.start()
+    barrier.wait()
+    start = time.perf_counter()
+    end = max(results.get() for _ in processes)
+    for process in processes:
+        process.join()
+    wall_time = end - start
+    audio_seconds = worker_count * REPEATS * len(audio) / MODEL_RATE
+    return cpu_threads, wall_time, audio_seconds
+
+if __name__ == "__main__":
+    audio = load_audio()
+    print(f'{"workers":>8} {"threads":>8} {"wall (s)":>10} {"audio (s)":>10} {"agg. RTF":>10} {"speedup":>8}')
+    baseline = None
+    for worker_count in [count for count in WORKER_COUNTS if count <= os.cpu_count()]:
+        cpu_threads, wall_time, audio_seconds = measure(worker_count, audio)
+        rtf = wall_time / audio_seconds
+        baseline = baseline or rtf
+        print(f'{worker_count:>8} {cpu_threads:>8} {wall_time:>10.2f} {audio_seconds:>10.1f} {rtf:>10.4f} {baseline / rtf:>8.2f}')